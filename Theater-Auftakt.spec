@@ -1,12 +1,33 @@
 # -*- mode: python ; coding: utf-8 -*-
+# Build with: pyinstaller Theater-Auftakt.spec
+#   or, for the fast-starting folder build: pyinstaller Theater-Auftakt.spec -- --onedir
+# The GUI runs the tools in its own process (tool_loader.load_tool), so the tool
+# scripts are bundled next to the shared modules, and what they import is listed
+# as hidden imports (PyInstaller cannot see imports inside data files).
+#
+# The default single-file executable unpacks itself to a temporary folder on every
+# start. With --onedir the program is built as a folder (dist/Theater-Auftakt/) that
+# starts directly, without UPX compression, which is much faster on slow machines.
 
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--onedir', action='store_true',
+                    help='build an unpacked folder instead of a single executable')
+options = parser.parse_args()
+
+TOOL_SCRIPTS = ['flatten-folder.py', 'convert-audio.py', 'concatenate-audio.py', 'generate-cards.py']
 
 a = Analysis(
     ['gui-launcher.py'],
     pathex=[],
     binaries=[],
-    datas=[],
-    hiddenimports=[],
+    datas=[(script, '.') for script in TOOL_SCRIPTS],
+    hiddenimports=[
+        'folder_scan', 'audio_probe', 'run_metrics', 'job_control', 'tool_loader',
+        'pcm_cache', 'audio_dsp', 'silence_split', 'mmap',
+        'pydub', 'sqlite3', 'cProfile', 'pstats', 'zipfile', 'uuid', 'tempfile',
+    ],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -16,19 +37,11 @@ a = Analysis(
 )
 pyz = PYZ(a.pure)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.datas,
-    [],
+exe_options = dict(
     name='Theater-Auftakt',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -36,3 +49,34 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+
+if options.onedir:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        upx=False,
+        **exe_options,
+    )
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.datas,
+        strip=False,
+        upx=False,
+        upx_exclude=[],
+        name='Theater-Auftakt',
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.datas,
+        [],
+        upx=True,
+        upx_exclude=[],
+        runtime_tmpdir=None,
+        **exe_options,
+    )
@@ -0,0 +1,39 @@
+"""
+Streaming decode for the tools: ffmpeg turns an audio file into raw 16-bit PCM
+(s16le) at a given sample rate and channel count, which is read from its stdout
+a chunk at a time, so long recordings are never held in memory as a whole.
+"""
+
+import subprocess
+import tempfile
+from run_metrics import metrics
+from job_control import check_cancelled, tracked_process
+
+READ_SIZE = 1024 * 1024
+
+
+def pcm_chunks(path, sample_rate, channels, label="decode", read_size=READ_SIZE):
+    """
+    Decode an audio file with ffmpeg and yield its raw 16-bit PCM in chunks of up to
+    read_size bytes. The ffmpeg run is recorded under label in the run metrics.
+    Raises RuntimeError if ffmpeg cannot decode the file.
+    """
+    with metrics.subprocess(label), tempfile.TemporaryFile() as stderr_file:
+        # stderr goes to a file: a pipe that is only read at the end would stall ffmpeg once it is full
+        process = subprocess.Popen(
+            ['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', path,
+             '-f', 's16le', '-ar', str(sample_rate), '-ac', str(channels), 'pipe:1'],
+            stdout=subprocess.PIPE, stderr=stderr_file
+        )
+        with tracked_process(process):
+            try:
+                for chunk in iter(lambda: process.stdout.read(read_size), b""):
+                    yield chunk
+            finally:
+                process.stdout.close()
+                returncode = process.wait()
+                stderr_file.seek(0)
+                stderr = stderr_file.read().decode(errors="replace").strip()
+                if returncode != 0:
+                    check_cancelled()
+                    raise RuntimeError(f"ffmpeg could not decode {path}: {stderr}")
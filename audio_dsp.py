@@ -0,0 +1,125 @@
+"""
+Optional processing between the clips of a concatenation: silence gaps, equal-power
+crossfades and per-clip loudness normalisation. Clips arrive as 16-bit PCM buffers
+(decoded clips or memory maps from the PCM cache) and are processed in blocks with
+NumPy, so only one block of a clip is converted at a time and the show as a whole
+is never held in memory. NumPy is only needed for crossfades and normalisation.
+"""
+
+import math
+from pcm_cache import SAMPLE_WIDTH
+
+BLOCK_FRAMES = 65536  # frames converted to floating point at a time
+MAX_GAIN_DB = 20.0    # normalisation never amplifies more than this (quiet clips are mostly noise)
+FULL_SCALE = 32768.0
+
+
+def require_numpy(feature="crossfades and loudness normalisation"):
+    """Import NumPy on first use; raise ImportError with install instructions if it is missing."""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(f"NumPy is needed for {feature} (pip install numpy)")
+    return numpy
+
+
+class ClipProcessor:
+    """
+    Turns the PCM of consecutive clips into the PCM of the joined output:
+    `gap` seconds of silence between clips, or a `crossfade` of that many seconds
+    (equal power: the clips' gains follow cos/sin, so the loudness stays even),
+    and with `normalize` every clip is scaled to that RMS level in dBFS, limited
+    so that its peaks do not clip. Call start() with the output format, process()
+    for every clip in order and finish() after the last one.
+    """
+
+    def __init__(self, gap=0.0, crossfade=0.0, normalize=None):
+        self.gap = gap
+        self.crossfade = crossfade
+        self.normalize = normalize
+        self.np = require_numpy() if crossfade or normalize is not None else None
+
+    def start(self, sample_rate, channels):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.silence = bytes(int(round(self.gap * sample_rate)) * channels * SAMPLE_WIDTH)
+        self.fade_frames = int(round(self.crossfade * sample_rate))
+        self.clips = 0
+        self.pending = None  # end of the previous clip, held back for the crossfade
+
+    def process(self, pcm):
+        """
+        Yield the output PCM for the next clip (a buffer of 16-bit samples in the
+        started format). With a crossfade, the end of the clip is held back until
+        the next clip (or finish()) arrives.
+        """
+        width = self.channels * SAMPLE_WIDTH
+        frames = len(pcm) // width
+        if self.clips and self.silence:
+            yield self.silence
+        self.clips += 1
+        if self.np is None:
+            view = memoryview(pcm)
+            try:
+                for start in range(0, frames * width, BLOCK_FRAMES * width):
+                    with view[start:start + BLOCK_FRAMES * width] as block:
+                        yield block
+            finally:
+                view.release()
+            return
+
+        np = self.np
+        channels = self.channels
+        samples = np.frombuffer(pcm, dtype="<i2", count=frames * channels)
+        gain = self.clip_gain(samples) if self.normalize is not None else 1.0
+
+        head = 0
+        if self.pending is not None:
+            head = min(self.fade_frames, frames // 2, len(self.pending) // channels)
+            keep = len(self.pending) - head * channels
+            if keep:
+                yield self.to_pcm(self.pending[:keep])
+            if head:
+                fade_in = self.curve(head, np.sin)
+                fade_out = self.curve(head, np.cos)
+                incoming = samples[:head * channels].astype(np.float32) * gain
+                yield self.to_pcm(self.pending[keep:] * fade_out + incoming * fade_in)
+        tail = min(self.fade_frames, frames - head) if self.fade_frames else 0
+
+        for start in range(head * channels, (frames - tail) * channels, BLOCK_FRAMES * channels):
+            end = min(start + BLOCK_FRAMES * channels, (frames - tail) * channels)
+            yield self.to_pcm(samples[start:end].astype(np.float32) * gain)
+        if self.fade_frames:
+            self.pending = samples[(frames - tail) * channels:].astype(np.float32) * gain
+        del samples  # the buffer may be a memory map that is closed after this clip
+
+    def finish(self):
+        """Yield what is still held back after the last clip."""
+        if self.pending is not None and len(self.pending):
+            yield self.to_pcm(self.pending)
+        self.pending = None
+
+    def clip_gain(self, samples):
+        """Return the factor that brings a clip to the normalisation level without clipping its peaks."""
+        np = self.np
+        total = 0.0
+        peak = 0.0
+        for start in range(0, len(samples), BLOCK_FRAMES * self.channels):
+            block = samples[start:start + BLOCK_FRAMES * self.channels].astype(np.float64)
+            total += float(np.dot(block, block))
+            peak = max(peak, float(np.abs(block).max()))
+        if not total:
+            return 1.0  # digital silence stays silent
+        rms_db = 20 * math.log10(math.sqrt(total / len(samples)) / FULL_SCALE)
+        gain = 10 ** (min(self.normalize - rms_db, MAX_GAIN_DB) / 20)
+        return min(gain, (FULL_SCALE - 1) / peak)
+
+    def curve(self, frames, function):
+        """Return an equal-power fade curve (np.sin: in, np.cos: out) over `frames` frames, per sample."""
+        np = self.np
+        position = (np.arange(frames, dtype=np.float32) + 0.5) / frames
+        return np.repeat(function(position * (math.pi / 2)), self.channels).astype(np.float32)
+
+    def to_pcm(self, block):
+        np = self.np
+        return np.clip(np.rint(block), -FULL_SCALE, FULL_SCALE - 1).astype("<i2").tobytes()
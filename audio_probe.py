@@ -0,0 +1,174 @@
+"""
+Audio metadata for the tools: runs ffprobe on many files in parallel and keeps
+the results (duration, codec, sample rate, channels, bitrate) in an optional
+on-disk cache keyed by path, size and modification time, so a preflight check
+of a large production only probes files that are new or changed.
+"""
+
+import json
+import os
+import sqlite3
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from run_metrics import metrics
+from job_control import run_process, submit
+
+PROBE_ENTRIES = "stream=codec_name,sample_rate,channels,bit_rate:format=duration,bit_rate"
+
+
+def probe_audio(path):
+    """
+    Return the metadata of the first audio stream of a file as a dict with
+    'duration' (seconds), 'codec', 'sample_rate', 'channels' and 'bit_rate'.
+    Raises ValueError if ffprobe cannot read the file or finds no audio stream.
+    """
+    try:
+        with metrics.subprocess("probe"):
+            result = run_process(
+                ['ffprobe', '-v', 'error', '-select_streams', 'a:0',
+                 '-show_entries', PROBE_ENTRIES, '-of', 'json', path],
+                check=True, capture_output=True, text=True
+            )
+    except subprocess.CalledProcessError as e:
+        raise ValueError(e.stderr.strip() or str(e))
+    except OSError as e:
+        raise ValueError(str(e))
+    data = json.loads(result.stdout)
+    streams = data.get("streams")
+    if not streams:
+        raise ValueError(f"no audio stream in {path}")
+    stream = streams[0]
+    container = data.get("format", {})
+    try:
+        return {
+            "duration": float(container.get("duration") or 0),
+            "codec": stream["codec_name"],
+            "sample_rate": int(stream["sample_rate"]),
+            "channels": int(stream["channels"]),
+            "bit_rate": int(stream.get("bit_rate") or container.get("bit_rate") or 0),
+        }
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"incomplete stream information in {path}: {e}")
+
+
+def audio_format(info):
+    """Return (codec, sample_rate, channels) of probed metadata."""
+    return info["codec"], info["sample_rate"], info["channels"]
+
+
+class ProbeCache:
+    """
+    SQLite cache of probe results, keyed by file path, size and modification time.
+    Failed probes are cached too, so a broken file is not probed again until it changes.
+    """
+
+    def __init__(self, db_path):
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS probes (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, info TEXT)"
+        )
+
+    def lookup(self, path, stat):
+        """Return the cached metadata (or {'error': message}) of a file, or None if it changed."""
+        row = self.connection.execute(
+            "SELECT size, mtime_ns, info FROM probes WHERE path = ?", (os.path.abspath(path),)
+        ).fetchone()
+        if row is None or (row[0], row[1]) != (stat.st_size, stat.st_mtime_ns):
+            return None
+        return json.loads(row[2])
+
+    def store(self, path, stat, info):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO probes (path, size, mtime_ns, info) VALUES (?, ?, ?, ?)",
+            (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, json.dumps(info)),
+        )
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _probe_result(path):
+    """Probe one file for probe_files; errors are returned as {'error': message}."""
+    try:
+        return probe_audio(path)
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+def probe_files(paths, jobs=1, cache=None):
+    """
+    Probe every file on up to `jobs` ffprobe processes and return {path: metadata}.
+    Unreadable files map to {'error': message}. With a cache (a ProbeCache), files
+    unchanged since they were last probed are not probed again.
+    """
+    results = {}
+    pending = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            results[path] = {"error": str(e)}
+            continue
+        cached = cache.lookup(path, stat) if cache else None
+        if cached is not None:
+            results[path] = cached
+        else:
+            pending[path] = stat
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {submit(executor, _probe_result, path): path for path in pending}
+            for future in as_completed(futures):
+                path = futures[future]
+                results[path] = future.result()
+                if cache:
+                    cache.store(path, pending[path], results[path])
+    if cache:
+        print(f"Probed {len(pending)} file(s), {len(results) - len(pending)} from cache")
+    return results
+
+
+def find_problems(infos):
+    """Return (path, reason) for every probed file that is unreadable or has no audio (zero length)."""
+    problems = []
+    for path, info in infos.items():
+        if "error" in info:
+            problems.append((path, info["error"]))
+        elif info["duration"] <= 0:
+            problems.append((path, "zero-length audio"))
+    return problems
+
+
+def format_duration(seconds):
+    """Format seconds as H:MM:SS."""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}"
+
+
+def preflight(paths, jobs=1, cache_path=None):
+    """
+    Probe all files before a long job, print the total duration and every problem
+    found, and return (metadata by path, list of (path, reason) problems).
+    """
+    paths = list(paths)
+    with metrics.stage("probe"):
+        if cache_path:
+            with ProbeCache(cache_path) as cache:
+                infos = probe_files(paths, jobs, cache)
+        else:
+            infos = probe_files(paths, jobs)
+    metrics.count("probe", len(paths))
+    problems = find_problems(infos)
+    total = sum(info.get("duration", 0) for info in infos.values() if "error" not in info)
+    print(f"Preflight: {len(paths)} file(s), total duration {format_duration(total)}, {len(problems)} problem(s)")
+    for path, reason in sorted(problems):
+        print(f"  PROBLEM: {path}: {reason}")
+    return infos, problems
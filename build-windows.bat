@@ -14,10 +14,25 @@ if errorlevel 1 (
 )
 
 echo.
-echo Building executable...
-pyinstaller --onefile --windowed --name "Theater-Auftakt" gui-launcher.py
+REM "build-windows.bat onedir" builds the fast-starting folder version
+if /I "%~1"=="onedir" (
+    echo Building executable folder...
+    pyinstaller --noconfirm Theater-Auftakt.spec -- --onedir
+) else (
+    echo Building executable...
+    pyinstaller --noconfirm Theater-Auftakt.spec
+)
 
-if exist "dist\Theater-Auftakt.exe" (
+if /I "%~1"=="onedir" (
+    if exist "dist\Theater-Auftakt\Theater-Auftakt.exe" (
+        echo.
+        echo SUCCESS! Program folder created: dist\Theater-Auftakt
+        echo Distribute the whole folder; users start Theater-Auftakt.exe inside it.
+    ) else (
+        echo.
+        echo ERROR: Build failed. Check the output above for errors.
+    )
+) else if exist "dist\Theater-Auftakt.exe" (
     echo.
     echo SUCCESS! Executable created: dist\Theater-Auftakt.exe
     echo You can now distribute this .exe file to users.
@@ -1,42 +1,327 @@
 import os
-import re
 import sys
-from pydub import AudioSegment
+import subprocess
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from folder_scan import list_audio_files, list_folder
+from audio_probe import audio_format, preflight
+from audio_decode import pcm_chunks
+from run_metrics import collect_metrics, metrics
+from job_control import check_cancelled, run_process, submit, tracked_process
+from pcm_cache import SAMPLE_WIDTH, PcmCache, map_pcm
+from audio_dsp import ClipProcessor
 
-def extract_number(filename):
-    """Extracts the number from filenames like 'audio (123).m4a' for correct sorting."""
-    match = re.search(r'\((\d+)\)', filename)
-    return int(match.group(1)) if match else 1  # Default to 1 if no number is found
+CHUNK_SIZE = 1024 * 1024  # bytes of PCM handed to the encoder per write
+READ_AHEAD_BYTES = 512 * 1024 * 1024  # decoded PCM that may wait for its turn with --jobs above 1
+DEFAULT_SAMPLE_RATE = 44100
+DEFAULT_CHANNELS = 2
+
+def collect_audio_files(source_folder_path):
+    """Return the paths of all audio files in the order they are concatenated."""
+    audio_paths = []
+    # Process subdirectories and their files in natural order ('Scene2' before 'Scene10')
+    for subdir_name in list_folder(source_folder_path)[0]:
+        subdir_path = os.path.join(source_folder_path, subdir_name)
+        audio_paths.extend(os.path.join(subdir_path, f) for f in list_audio_files(subdir_path))
+    return audio_paths
+
+def probe_formats(audio_paths, jobs=1, probe_cache=None):
+    """
+    Probe every file on up to `jobs` ffprobe processes and return {path: (codec, sample_rate, channels)}.
+    Unreadable and zero-length files are reported and left out.
+    Returns (formats, durations, problems) with durations in seconds by path and
+    problems as (path, reason) pairs.
+    """
+    infos, problems = preflight(audio_paths, jobs, probe_cache)
+    skipped = {path for path, _ in problems}
+    formats = {path: audio_format(infos[path]) for path in audio_paths if path not in skipped}
+    durations = {path: infos[path]["duration"] for path in formats}
+    return formats, durations, problems
+
+def decode_clip(path, sample_rate, channels):
+    """Decode a whole audio file with ffmpeg and return its raw 16-bit PCM."""
+    with metrics.subprocess("decode"):
+        result = run_process(
+            ['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', path,
+             '-f', 's16le', '-ar', str(sample_rate), '-ac', str(channels), 'pipe:1'],
+            capture_output=True
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode {path}: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
+
+def decode_in_order(decode, audio_paths, jobs, size=None, max_bytes=None):
+    """
+    Run decode(path) for every path on up to `jobs` worker threads and yield
+    (path, future) pairs strictly in input order. A new file is only submitted
+    once the oldest one has been handed over, so this reorder buffer never holds
+    more than `jobs` decoded files at a time. With size (bytes a path decodes to)
+    and max_bytes, files are also only submitted while the files waiting for their
+    turn add up to at most max_bytes; a larger file waits until it is the only one.
+    """
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        held = 0
+        for path in audio_paths:
+            cost = size(path) if size else 0
+            while pending and (len(pending) >= jobs or (max_bytes is not None and held + cost > max_bytes)):
+                ready_path, future, ready_cost = pending.popleft()
+                held -= ready_cost
+                yield ready_path, future
+            pending.append((path, submit(executor, decode, path), cost))
+            held += cost
+        while pending:
+            ready_path, future, _ = pending.popleft()
+            yield ready_path, future
+
+def clip_chunks(future):
+    """Yield the PCM decoded by a decode_clip future in CHUNK_SIZE slices without copying it."""
+    pcm = memoryview(future.result())
+    for start in range(0, len(pcm), CHUNK_SIZE):
+        yield pcm[start:start + CHUNK_SIZE]
+
+def ahead_chunks(path, future, sample_rate, channels):
+    """Yield the PCM of a clip decoded ahead by its future, or stream-decode it now if it was too long for that."""
+    if future.result() is None:
+        yield from pcm_chunks(path, sample_rate, channels)
+    else:
+        yield from clip_chunks(future)
+
+def mapped_chunks(pcm_cache, future):
+    """
+    Yield the PCM cached by a pcm_cache.pcm_path future in CHUNK_SIZE slices of a
+    memory map. Each slice is released once the next one is requested, and the
+    cache entry once the clip has been read.
+    """
+    pcm_path = future.result()
+    try:
+        with map_pcm(pcm_path) as pcm:
+            for start in range(0, len(pcm), CHUNK_SIZE):
+                with pcm[start:start + CHUNK_SIZE] as chunk:
+                    yield chunk
+    finally:
+        pcm_cache.release(pcm_path)
+
+def processed_chunks(processor, future, pcm_cache=None):
+    """
+    Yield the output of the processing stage for one clip, given the future of its
+    decode_clip (the PCM) or, with a pcm_cache, of its pcm_cache.pcm_path (read
+    through a memory map and released afterwards).
+    """
+    if pcm_cache is None:
+        yield from processor.process(future.result())
+        return
+    pcm_path = future.result()
+    try:
+        with map_pcm(pcm_path) as pcm:
+            yield from processor.process(pcm)
+    finally:
+        pcm_cache.release(pcm_path)
+
+def open_encoder(output_path, sample_rate, channels):
+    """Start an ffmpeg process that encodes raw 16-bit PCM from its stdin to an MP4 (AAC) file."""
+    return subprocess.Popen(
+        ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y',
+         '-f', 's16le', '-ar', str(sample_rate), '-ac', str(channels), '-i', 'pipe:0',
+         '-c:a', 'aac', '-f', 'mp4', output_path],
+        stdin=subprocess.PIPE
+    )
+
+def concatenate_audio_pydub(audio_paths, output_path, jobs=1, formats=None, pcm_cache=None):
+    """
+    Concatenates audio files in memory with pydub (decodes the whole show into RAM).
+    With a pcm_cache (and the probed formats), clips decoded by an earlier run are reused.
+    """
+    # Imported here so that the default engine and the usage output do not pay for loading pydub
+    from pydub import AudioSegment
 
-def concatenate_audio(source_folder_path, output_path):
-    """Concatenates all audio files in the same order as they would be processed."""
     full_audio = AudioSegment.silent(duration=0)  # Start with silence
 
+    def decode(path):
+        if pcm_cache is None or path not in formats:
+            return AudioSegment.from_file(path, format="m4a")
+        _, sample_rate, channels = formats[path]
+        with pcm_cache.open_pcm(path, sample_rate, channels) as pcm:
+            return AudioSegment(data=bytes(pcm), sample_width=SAMPLE_WIDTH, frame_rate=sample_rate, channels=channels)
+
+    # Decode up to `jobs` files at once, but append them strictly in order
+    for source_path, future in decode_in_order(decode, audio_paths, jobs):
+        check_cancelled()
+        full_audio += future.result()  # Append in order
+        metrics.count("encode", 1, os.path.getsize(source_path))
+
+    # Export final concatenated audio
+    with metrics.subprocess("encode"):
+        full_audio.export(output_path, format="mp4")
+
+def concatenate_audio_copy(audio_paths, output_path):
+    """
+    Joins audio files at the container level with ffmpeg's concat demuxer, copying
+    the encoded audio without re-encoding. All inputs must share codec, sample rate
+    and channel layout.
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as list_file:
+        for source_path in audio_paths:
+            escaped = os.path.abspath(source_path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+    try:
+        with metrics.subprocess("encode"):
+            run_process(
+                ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-f', 'concat', '-safe', '0',
+                 '-i', list_file.name, '-c', 'copy', '-f', 'mp4', output_path],
+                check=True, capture_output=True, text=True
+            )
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg could not join the files: {e.stderr.strip()}")
+    finally:
+        os.remove(list_file.name)
+    metrics.count("encode", len(audio_paths), sum(os.path.getsize(path) for path in audio_paths))
+    print(f"Joined {len(audio_paths)} file(s) without re-encoding")
+
+def concatenate_audio_stream(audio_paths, output_path, formats=None, jobs=1, pcm_cache=None, processor=None,
+                             durations=None):
+    """
+    Concatenates audio files by streaming decoded PCM into a single ffmpeg encoder.
+    With jobs=1 only one chunk is held in memory at a time; with more jobs up to
+    `jobs` files are decoded ahead in parallel, as long as the decoded files waiting
+    for their turn fit in READ_AHEAD_BYTES (sized from their probed durations).
+    Longer files are stream-decoded when their turn comes. Either way memory use
+    does not grow with the length of the output or of the clips. Like pydub, all clips are converted to the highest
+    sample rate and channel count found among the inputs.
+    With a pcm_cache, clips are decoded into the cache (up to `jobs` at a time,
+    none if they were decoded before) and streamed from its memory maps.
+    With a processor (a ClipProcessor), gaps, crossfades and normalisation are
+    applied between decoding and encoding, one clip at a time; without a pcm_cache
+    each clip is then held in memory whole.
+    """
+    if formats is None:
+        formats, durations, _ = probe_formats(audio_paths, jobs)
+    if formats:
+        sample_rate = max(rate for _, rate, _ in formats.values())
+        channels = max(count for _, _, count in formats.values())
+    else:
+        sample_rate, channels = DEFAULT_SAMPLE_RATE, DEFAULT_CHANNELS
+    print(f"Output format: {sample_rate} Hz, {channels} channel(s)")
+
+    readable_paths = [path for path in audio_paths if path in formats]
+
+    def pcm_size(path):
+        # Unknown durations count as too long to be decoded ahead
+        duration = durations.get(path) if durations else None
+        return READ_AHEAD_BYTES + 1 if duration is None else int(duration * sample_rate) * channels * SAMPLE_WIDTH
+
+    if processor is not None:
+        # The processing stage needs whole clips: memory-mapped from the cache or decoded into memory
+        processor.start(sample_rate, channels)
+        if pcm_cache is not None:
+            decode = lambda path: pcm_cache.pcm_path(path, sample_rate, channels)
+            ordered = decode_in_order(decode, readable_paths, jobs)
+        else:
+            decode = lambda path: decode_clip(path, sample_rate, channels)
+            ordered = decode_in_order(decode, readable_paths, jobs, pcm_size, READ_AHEAD_BYTES)
+        clips = ((path, processed_chunks(processor, future, pcm_cache)) for path, future in ordered)
+    elif pcm_cache is not None:
+        cached = lambda path: pcm_cache.pcm_path(path, sample_rate, channels)
+        clips = ((path, mapped_chunks(pcm_cache, future)) for path, future in decode_in_order(cached, readable_paths, jobs))
+    elif jobs > 1:
+        # Clips too long to wait in memory are decoded (to None) when their turn comes instead
+        ahead_size = lambda path: 0 if pcm_size(path) > READ_AHEAD_BYTES else pcm_size(path)
+        decode = lambda path: decode_clip(path, sample_rate, channels) if ahead_size(path) else None
+        clips = ((path, ahead_chunks(path, future, sample_rate, channels))
+                 for path, future in decode_in_order(decode, readable_paths, jobs, ahead_size, READ_AHEAD_BYTES))
+    else:
+        clips = ((path, pcm_chunks(path, sample_rate, channels)) for path in readable_paths)
+
+    with metrics.subprocess("encode"):
+        encoder = open_encoder(output_path, sample_rate, channels)
+        with tracked_process(encoder):
+            try:
+                for index, (source_path, chunks) in enumerate(clips, 1):
+                    check_cancelled()
+                    try:
+                        for chunk in chunks:
+                            encoder.stdin.write(chunk)
+                        metrics.count("encode", 1, os.path.getsize(source_path))
+                        print(f"[{index}/{len(readable_paths)}] Added {source_path}")
+                    except RuntimeError as e:
+                        print(f"[{index}/{len(readable_paths)}] Error: {e}")
+                if processor is not None:
+                    for chunk in processor.finish():
+                        encoder.stdin.write(chunk)
+            finally:
+                encoder.stdin.close()
+                if encoder.wait() != 0:
+                    check_cancelled()
+                    raise RuntimeError(f"ffmpeg could not encode {output_path}")
+
+def concatenate_audio(source_folder_path, output_path, engine="stream", stream_copy=False, jobs=1,
+                      check=False, probe_cache=None, pcm_cache=None, processor=None):
+    """
+    Concatenates all audio files in the same order as they would be processed.
+    With stream_copy, files that share codec, sample rate and channel count are
+    joined without re-encoding; otherwise the decoding engine is used, decoding
+    up to `jobs` files in parallel (or reusing their PCM from pcm_cache, a PcmCache).
+    A processor (a ClipProcessor, stream engine only) adds gaps, crossfades or
+    normalisation; the files are then always re-encoded.
+    All files are probed first (results cached in probe_cache, if given); with
+    check, nothing is written if any file is unreadable or empty.
+    Returns False if nothing was written.
+    """
     # Ensure the source folder exists
     if not os.path.exists(source_folder_path):
         print("Error: Source folder does not exist.")
-        return
-
-    # Process subdirectories in sorted order (as in original script)
-    for subdir_name in sorted(os.listdir(source_folder_path)):
-        subdir_path = os.path.join(source_folder_path, subdir_name)
-        if os.path.isdir(subdir_path):
-            audio_files = sorted(
-                (f for f in os.listdir(subdir_path) if f.endswith('.m4a')),
-                key=extract_number
-            )
+        return False
 
-            # Process files one by one (instead of pairs)
-            for audio_file in audio_files:
-                source_path = os.path.join(subdir_path, audio_file)
+    with metrics.stage("scan"):
+        audio_paths = collect_audio_files(source_folder_path)
+    return concatenate_files(audio_paths, output_path, engine, stream_copy, jobs, check, probe_cache, pcm_cache,
+                             processor)
 
-                if os.path.exists(source_path):
-                    audio_segment = AudioSegment.from_file(source_path, format="m4a")
-                    full_audio += audio_segment  # Append in order
+def concatenate_files(audio_paths, output_path, engine="stream", stream_copy=False, jobs=1,
+                      check=False, probe_cache=None, pcm_cache=None, processor=None):
+    """Concatenates the given audio files in list order; see concatenate_audio for the options."""
+    formats = durations = None
+    if stream_copy or check or engine == "stream" or pcm_cache is not None:
+        formats, durations, problems = probe_formats(audio_paths, jobs, probe_cache)
+        if check and problems:
+            print("Nothing was written. Fix or remove the files listed above and run again.")
+            return False
+    if stream_copy and processor is not None:
+        print("Stream copy not possible with gaps, crossfades or normalisation, re-encoding instead")
+    elif stream_copy:
+        distinct = set(formats.values())
+        if len(formats) == len(audio_paths) and len(distinct) == 1:
+            try:
+                with metrics.stage("encode"):
+                    concatenate_audio_copy(audio_paths, output_path)
+                print(f"Final concatenated audio saved at: {output_path}")
+                return True
+            except RuntimeError as e:
+                print(f"Stream copy failed, re-encoding instead: {e}")
+        elif len(formats) < len(audio_paths):
+            print("Stream copy not possible (unreadable or empty files), re-encoding instead")
+        else:
+            print("Stream copy not possible, the files differ in format:")
+            for codec, rate, count in sorted(distinct):
+                print(f"  {codec}, {rate} Hz, {count} channel(s)")
+            print("Re-encoding instead")
 
-    # Export final concatenated audio
-    full_audio.export(output_path, format="mp4")
+    with metrics.stage("encode"):
+        if engine == "pydub":
+            concatenate_audio_pydub(audio_paths, output_path, jobs, formats, pcm_cache)
+        else:
+            concatenate_audio_stream(audio_paths, output_path, formats, jobs, pcm_cache, processor, durations)
     print(f"Final concatenated audio saved at: {output_path}")
+    return True
+
+def get_option(argv, name, default=None):
+    """Return the value following an option like '--engine pydub', or default if it is absent."""
+    if name in argv:
+        index = argv.index(name)
+        if index + 1 < len(argv):
+            return argv[index + 1]
+    return default
 
 if __name__ == "__main__":
     print("=" * 70)
@@ -44,20 +329,39 @@ if __name__ == "__main__":
     print("=" * 70)
     print("WHAT THIS DOES:")
     print("  Concatenates all .m4a audio files from subdirectories into a single")
-    print("  output file. Files are processed in sorted order (by subdirectory")
-    print("  name, then by number in parentheses in filename).")
+    print("  output file. Files are processed in natural order (by subdirectory")
+    print("  name, then by file name; 'audio (2)' before 'audio (10)').")
     print("")
     print("PARAMETERS:")
     print("  <source-folder>  (required) Path to folder containing subdirectories")
     print("                    with .m4a files to concatenate")
     print("  <output-file>    (required) Full path to output file (e.g., ./output.m4a)")
+    print("  [--engine NAME]  (optional) 'stream' (default, constant memory) or")
+    print("                    'pydub' (decodes everything into memory)")
+    print("  [--stream-copy]  (optional) Join without re-encoding when all files")
+    print("                    share codec, sample rate and channels")
+    print("  [--jobs N]       (optional) Number of files decoded in parallel")
+    print("                    (default: number of CPU cores)")
+    print("  [--check]        (optional) Stop before writing if any file is")
+    print("                    unreadable or empty")
+    print("  [--probe-cache FILE] (optional) Cache of file metadata for faster checks")
+    print("  [--pcm-cache DIR] (optional) Cache of decoded audio reused by later runs")
+    print("  [--pcm-cache-size MB] (optional) Size limit of the PCM cache (default: 4096)")
+    print("  [--gap SECONDS]  (optional) Silence inserted between clips")
+    print("  [--crossfade SECONDS] (optional) Crossfade between clips (needs NumPy)")
+    print("  [--normalize DBFS] (optional) Bring every clip to this level (needs NumPy)")
+    print("  [--metrics FILE] (optional) Write per-stage timings and resource use as JSON")
+    print("  [--profile FILE] (optional) Write a cProfile dump of the run")
     print("")
     
     if len(sys.argv) < 3:
         print("ERROR: Missing required parameters")
         print("")
         print("USAGE:")
-        print("  python3 concatenate-audio.py <source-folder> <output-file>")
+        print("  python3 concatenate-audio.py <source-folder> <output-file> [--engine stream|pydub] [--stream-copy] [--jobs N]")
+        print("                              [--check] [--probe-cache FILE] [--pcm-cache DIR] [--pcm-cache-size MB]")
+        print("                              [--gap SECONDS | --crossfade SECONDS] [--normalize DBFS]")
+        print("                              [--metrics FILE] [--profile FILE]")
         print("")
         print("EXAMPLE:")
         print("  python3 concatenate-audio.py data/twice-in-a-lifetime ./final_audio.m4a")
@@ -71,10 +375,124 @@ if __name__ == "__main__":
         print("  <output-file>:   Full path where the concatenated audio will be saved.")
         print("                   Can be relative (e.g., './output.m4a') or absolute.")
         print("                   Directory will be created if it doesn't exist.")
+        print("")
+        print("  [--engine NAME]: (optional) 'stream' decodes the clips one chunk at a time")
+        print("                   and feeds them to a single ffmpeg encoder, so memory use")
+        print("                   stays constant however long the output is. 'pydub' is the")
+        print("                   previous in-memory engine.")
+        print("")
+        print("  [--stream-copy]: (optional) Check the files with ffprobe first. If they all")
+        print("                   use the same codec, sample rate and channel count, they")
+        print("                   are joined without re-encoding (fast, no quality loss).")
+        print("                   Otherwise the selected engine is used.")
+        print("")
+        print("  [--jobs N]:      (optional) How many files are decoded at the same time when")
+        print("                   re-encoding. Files are still joined in order; decoded")
+        print("                   files wait in memory only up to 512 MB in total (longer")
+        print("                   files are decoded while they are written). Defaults to")
+        print("                   the number of CPU cores.")
+        print("")
+        print("  [--check]:       (optional) Check all files with ffprobe before starting and")
+        print("                   stop without writing anything if a file is unreadable or")
+        print("                   has no audio. Without it, such files are skipped.")
+        print("")
+        print("  [--probe-cache FILE]: (optional) File in which the ffprobe results are")
+        print("                   remembered (created if it doesn't exist). Later runs only")
+        print("                   probe files that are new or changed.")
+        print("")
+        print("  [--pcm-cache DIR]: (optional) Folder in which every clip is kept decoded")
+        print("                   (created if it doesn't exist). Later runs over the same")
+        print("                   recordings read it back from disk instead of decoding")
+        print("                   again. The least recently used clips are deleted when")
+        print("                   the folder grows beyond --pcm-cache-size MB.")
+        print("")
+        print("  [--gap SECONDS]: (optional) Insert this much silence between clips")
+        print("                   (e.g., '--gap 1.5').")
+        print("")
+        print("  [--crossfade SECONDS]: (optional) Overlap the end of each clip with the")
+        print("                   start of the next one, fading one out and the other in")
+        print("                   at constant loudness. Cannot be combined with --gap.")
+        print("")
+        print("  [--normalize DBFS]: (optional) Scale every clip to the same average level,")
+        print("                   in dB below full scale (e.g., '--normalize -20'). Peaks are")
+        print("                   never pushed into clipping.")
+        print("")
+        print("                   --gap, --crossfade and --normalize use the stream engine")
+        print("                   and always re-encode.")
+        print("")
+        print("  [--metrics FILE]: (optional) Write the time, CPU time, file and byte counts,")
+        print("                   ffmpeg time and peak memory of every stage to a JSON file.")
+        print("")
+        print("  [--profile FILE]: (optional) Profile the run (all threads) and write the")
+        print("                   cProfile statistics to FILE (view: python3 -m pstats FILE).")
         sys.exit(1)
     
     source_folder = sys.argv[1]
     output_file = sys.argv[2]
+    engine = get_option(sys.argv, "--engine", "stream")
+    stream_copy = "--stream-copy" in sys.argv
+    jobs = get_option(sys.argv, "--jobs", str(os.cpu_count() or 1))
+    check = "--check" in sys.argv
+    probe_cache = get_option(sys.argv, "--probe-cache")
+    pcm_cache_dir = get_option(sys.argv, "--pcm-cache")
+    pcm_cache_size = get_option(sys.argv, "--pcm-cache-size", "4096")
+    gap = get_option(sys.argv, "--gap", "0")
+    crossfade = get_option(sys.argv, "--crossfade", "0")
+    normalize = get_option(sys.argv, "--normalize")
+    metrics_path = get_option(sys.argv, "--metrics")
+    profile_path = get_option(sys.argv, "--profile")
+    
+    # Validate engine
+    if engine not in ("stream", "pydub"):
+        print(f"ERROR: '--engine {engine}' is not a known engine.")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print("  [--engine NAME]: Must be 'stream' or 'pydub'.")
+        sys.exit(1)
+    
+    # Validate job count
+    if not jobs.isdigit() or int(jobs) < 1:
+        print(f"ERROR: '--jobs {jobs}' is not a valid number of parallel jobs.")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print("  [--jobs N]:      Must be a positive whole number (e.g., '--jobs 4').")
+        sys.exit(1)
+    jobs = int(jobs)
+    
+    # Validate PCM cache size
+    if not pcm_cache_size.isdigit() or int(pcm_cache_size) < 1:
+        print(f"ERROR: '--pcm-cache-size {pcm_cache_size}' is not a valid size.")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print("  [--pcm-cache-size MB]: Must be a positive whole number of megabytes (e.g., '--pcm-cache-size 2048').")
+        sys.exit(1)
+    
+    # Validate processing options
+    try:
+        gap, crossfade = float(gap), float(crossfade)
+        normalize = None if normalize is None else float(normalize)
+        if gap < 0 or crossfade < 0 or (normalize is not None and normalize > 0):
+            raise ValueError
+    except ValueError:
+        print("ERROR: --gap, --crossfade or --normalize has an invalid value.")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print("  [--gap SECONDS], [--crossfade SECONDS]: Must be zero or more seconds (e.g., '--gap 1.5').")
+        print("  [--normalize DBFS]: Must be a level of zero or below (e.g., '--normalize -20').")
+        sys.exit(1)
+    if gap and crossfade:
+        print("ERROR: --gap and --crossfade cannot be combined.")
+        sys.exit(1)
+    processor = None
+    if gap or crossfade or normalize is not None:
+        if engine != "stream":
+            print("ERROR: --gap, --crossfade and --normalize need the stream engine.")
+            sys.exit(1)
+        try:
+            processor = ClipProcessor(gap, crossfade, normalize)
+        except ImportError as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
     
     # Validate source folder
     if not os.path.isdir(source_folder):
@@ -94,7 +512,24 @@ if __name__ == "__main__":
     
     print(f"Source folder: {source_folder}")
     print(f"Output file: {output_file}")
+    print(f"Engine: {engine}")
+    print(f"Stream copy: {stream_copy}")
+    print(f"Parallel jobs: {jobs}")
+    print(f"Preflight check: {check}")
+    print(f"Probe cache: {probe_cache or '(none)'}")
+    print(f"PCM cache: {pcm_cache_dir or '(none)'}")
+    if processor is not None:
+        print(f"Processing: gap {gap} s, crossfade {crossfade} s, normalize {'off' if normalize is None else f'{normalize} dBFS'}")
     print("=" * 70)
     print("")
     
-    concatenate_audio(source_folder, output_file)
+    with collect_metrics("concatenate-audio", metrics_path, profile_path):
+        if pcm_cache_dir:
+            with PcmCache(pcm_cache_dir, int(pcm_cache_size)) as pcm_cache:
+                concatenated = concatenate_audio(source_folder, output_file, engine, stream_copy, jobs, check,
+                                                 probe_cache, pcm_cache, processor)
+        else:
+            concatenated = concatenate_audio(source_folder, output_file, engine, stream_copy, jobs, check,
+                                             probe_cache, processor=processor)
+    if not concatenated:
+        sys.exit(1)
@@ -1,49 +1,287 @@
 import os
+import json
 import shutil
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from folder_scan import AUDIO_EXTENSION, ScanIndex, file_hash, walk_folder
+from run_metrics import collect_metrics, metrics
+from job_control import check_cancelled, run_process, submit
 
-def copy_folder(src, dest):
+MANIFEST_NAME = ".convert-manifest.json"
+MP3_ARGS = ['-codec:a', 'libmp3lame']
+
+# Output formats: name -> (file extension, encoder arguments, default quality arguments)
+FORMATS = {
+    "mp3": (".mp3", MP3_ARGS, []),
+    "aac": (".m4a", ['-vn', '-codec:a', 'aac'], ['-b:a', '128k']),
+    "opus": (".opus", ['-vn', '-codec:a', 'libopus'], ['-b:a', '96k']),
+    "ogg": (".ogg", ['-vn', '-codec:a', 'libvorbis'], ['-q:a', '5']),
+    "flac": (".flac", ['-vn', '-codec:a', 'flac'], []),
+}
+
+def parse_formats(format_list):
     """
-    Recursively copy a folder from src to dest.
+    Turn a list like 'mp3,opus:64k' into [(label, extension, ffmpeg args)]. A ':BITRATE'
+    after a format name replaces the quality setting of its preset.
+    Raises ValueError for unknown or repeated formats.
+    """
+    formats = []
+    for label in (item.strip() for item in format_list.split(",")):
+        name, _, bitrate = label.partition(":")
+        if name not in FORMATS:
+            raise ValueError(f"unknown format '{name}'")
+        if any(existing == label for existing, _, _ in formats):
+            raise ValueError(f"format '{label}' is listed twice")
+        extension, encoder_args, quality_args = FORMATS[name]
+        formats.append((label, extension, encoder_args + (['-b:a', bitrate] if bitrate else quality_args)))
+    return formats
+
+def format_trees(destination_folder, formats):
+    """
+    Return {label: folder} for the output formats: a single format is written straight
+    into destination_folder, several into one subfolder per format (e.g. 'mp3', 'opus-64k').
+    """
+    if len(formats) == 1:
+        return {formats[0][0]: destination_folder}
+    return {label: os.path.join(destination_folder, label.replace(":", "-")) for label, _, _ in formats}
+
+def mirror_other_files(src, dest, link=False, index=None):
     """
+    Recreate the folder structure of src in dest and copy every file that is not
+    an .m4a (those are encoded straight into dest by convert_m4a_to_mp3).
+    With link=True the files are hard-linked instead of copied where possible.
+    Files already present in dest with the same size and mtime are left alone.
+    """
+    copied = 0
+    with metrics.stage("mirror"):
+        for root, dirs, files in walk_folder(src, index):
+            check_cancelled()
+            dest_root = os.path.join(dest, os.path.relpath(root, src))
+            os.makedirs(dest_root, exist_ok=True)
+            for file in files:
+                if file.endswith(AUDIO_EXTENSION):
+                    continue
+                src_path = os.path.join(root, file)
+                dest_path = os.path.join(dest_root, file)
+                try:
+                    src_stat = os.stat(src_path)
+                    if os.path.exists(dest_path):
+                        dest_stat = os.stat(dest_path)
+                        if (dest_stat.st_size, dest_stat.st_mtime_ns) == (src_stat.st_size, src_stat.st_mtime_ns):
+                            continue
+                        os.remove(dest_path)
+                    if link:
+                        try:
+                            os.link(src_path, dest_path)
+                        except OSError:
+                            shutil.copy2(src_path, dest_path)
+                    else:
+                        shutil.copy2(src_path, dest_path)
+                    copied += 1
+                    metrics.count("mirror", 1, src_stat.st_size)
+                except OSError as e:
+                    print(f'Error copying {src_path}: {e}')
+    print(f"{'Linked' if link else 'Copied'} {copied} other file(s) from {src} to {dest}")
+
+def load_manifest(directory):
+    """Load the conversion manifest of a destination folder, or an empty one."""
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
     try:
-        shutil.copytree(src, dest)
-        print(f"Folder copied from {src} to {dest}")
-    except shutil.Error as e:
-        print(f'Error: {e}')
+        with open(manifest_path, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+    except FileNotFoundError:
+        return {"files": {}}
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable manifest {manifest_path}: {e}")
+        return {"files": {}}
+    manifest.setdefault("files", {})
+    return manifest
+
+def save_manifest(directory, manifest):
+    """Write the conversion manifest atomically into the destination folder."""
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+def is_unchanged(entry, m4a_path, output_path, sha256=None, ffmpeg_args=MP3_ARGS):
+    """
+    Check a manifest entry against the current input file and encoder arguments.
+    Size and mtime decide by default; given the input's content hash (sha256), a
+    matching recorded hash also counts as unchanged when only the mtime differs.
+    """
+    if not entry or entry.get("ffmpeg_args") != ffmpeg_args or not os.path.exists(output_path):
+        return False
+    stat = os.stat(m4a_path)
+    if entry.get("size") != stat.st_size:
+        return False
+    if entry.get("mtime_ns") == stat.st_mtime_ns:
+        return True
+    return sha256 is not None and entry.get("sha256") == sha256
+
+def convert_file(m4a_path, outputs):
+    """
+    Convert a single M4A file with ffmpeg into every (output path, ffmpeg args) of
+    outputs. All outputs come from one ffmpeg run, so the file is decoded only once.
+    Returns None on success, or the error message on failure.
+    """
+    args = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-i', m4a_path]
+    for output_path, ffmpeg_args in outputs:
+        args += ffmpeg_args + [output_path]
+    try:
+        with metrics.subprocess("convert"):
+            run_process(args, check=True, capture_output=True, text=True)
+        return None
+    except subprocess.CalledProcessError as e:
+        return e.stderr.strip() or str(e)
     except OSError as e:
-        print(f'Error: {e}')
+        return str(e)
 
-def convert_m4a_to_mp3(directory):
+def convert_job(m4a_path, outputs, use_hash):
     """
-    Recursively convert all M4A files found in the directory to MP3 format.
+    Worker job of convert_files for one input and its (label, output path, ffmpeg
+    args, manifest entry) outputs. With use_hash the input is hashed once, outputs
+    whose recorded hash matches are dropped and the rest are converted.
+    Returns a tuple (sha256, converted outputs, error) with error as in convert_file.
     """
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.endswith(".m4a"):
-                m4a_path = os.path.join(root, file)
-                mp3_path = os.path.splitext(m4a_path)[0] + '.mp3'
-                try:
-                    subprocess.run(['ffmpeg', '-i', m4a_path, mp3_path], check=True)
-                    print(f"Converted {m4a_path} to {mp3_path}")
-                except subprocess.CalledProcessError as e:
-                    print(f'Error during conversion: {e}')
+    sha256 = file_hash(m4a_path) if use_hash else None
+    if sha256 is not None:
+        outputs = [output for output in outputs
+                   if not is_unchanged(output[3], m4a_path, output[1], sha256, output[2])]
+    if not outputs:
+        return sha256, outputs, None
+    return sha256, outputs, convert_file(m4a_path, [(path, args) for _, path, args, _ in outputs])
 
+def convert_m4a_to_mp3(source_folder, destination_folder, jobs=None, use_hash=False, index=None, formats=None):
+    """
+    Recursively convert all M4A files found in source_folder to MP3 files at the
+    mirrored paths in destination_folder, reading each input directly from the source.
+    Conversions run in parallel on up to `jobs` ffmpeg processes (default: CPU count).
+    A manifest in the destination records every converted input, so files that are
+    unchanged since the last run are skipped and MP3s whose source disappeared are removed.
+    With an index (a ScanIndex), unchanged source folders are not listed again.
+    With formats (from parse_formats), every file is encoded into each of them from
+    a single decode, into the folders given by format_trees.
+    Returns a tuple (converted, failed): the number of files written and of inputs that failed.
+    """
+    inputs = []
+    with metrics.stage("scan"):
+        for root, dirs, files in walk_folder(source_folder, index):
+            for file in files:
+                if file.endswith(AUDIO_EXTENSION):
+                    m4a_path = os.path.join(root, file)
+                    inputs.append((os.path.relpath(m4a_path, source_folder), m4a_path))
+    return convert_files(inputs, destination_folder, jobs, use_hash, formats)
 
-def delete_m4a_files(directory):
+def convert_files(inputs, destination_folder, jobs=None, use_hash=False, formats=None, remove_stale=True):
     """
-    Delete all M4A files in the specified directory.
+    Convert (relative path, M4A path) inputs to files at the relative paths in
+    destination_folder (or its per-format folders); see convert_m4a_to_mp3. Inputs
+    may be a generator: each file is handed to the worker pool as soon as it is produced.
+    Every format folder has its own manifest; a file is only encoded into the formats
+    whose output is missing or outdated.
+    Outputs whose source is not among the inputs are only removed with remove_stale.
+    It may be a function, called once all inputs have been read, for inputs produced
+    by another stage that can only tell at the end whether it handed over every file.
     """
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if  ("m4a") in file:
-                m4a_path = os.path.join(root, file)
-                try:
-                    os.remove(m4a_path)
-                    print(f"Deleted {m4a_path}")
-                except OSError as e:
-                    print(f'Error deleting file {m4a_path}: {e}')
+    formats = formats or parse_formats("mp3")
+    trees = format_trees(destination_folder, formats)
+    manifests = {}
+    for label, tree in trees.items():
+        os.makedirs(tree, exist_ok=True)
+        manifests[label] = load_manifest(tree)
+    seen = set()
+    unchanged = 0
+
+    jobs = jobs or os.cpu_count() or 1
+    converted = 0
+    failed = []
+    with metrics.stage("convert"), ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for rel_path, m4a_path in inputs:
+            seen.add(rel_path)
+            outputs = []
+            for label, extension, ffmpeg_args in formats:
+                output_path = os.path.join(trees[label], os.path.splitext(rel_path)[0] + extension)
+                entry = manifests[label]["files"].get(rel_path)
+                if is_unchanged(entry, m4a_path, output_path, None, ffmpeg_args):
+                    unchanged += 1
+                else:
+                    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                    outputs.append((label, output_path, ffmpeg_args, entry))
+            if outputs:
+                # With use_hash the job hashes the input, off the thread that hands out work
+                future = submit(executor, convert_job, m4a_path, outputs, use_hash)
+                futures[future] = (rel_path, m4a_path, outputs)
+        for done, future in enumerate(as_completed(futures), 1):
+            rel_path, m4a_path, requested = futures[future]
+            sha256, outputs, error = future.result()
+            to_convert = {label for label, _, _, _ in outputs}
+            same_content = [label for label, _, _, _ in requested if label not in to_convert]
+            if same_content:
+                # Record the new mtime, so the file is not hashed again on every later run
+                unchanged += len(same_content)
+                stat = os.stat(m4a_path)
+                for label in same_content:
+                    manifests[label]["files"][rel_path].update(
+                        size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=sha256)
+            if not outputs:
+                print(f"[{done}/{len(futures)}] {m4a_path} is unchanged (same content)")
+            elif error is None:
+                converted += len(outputs)
+                stat = os.stat(m4a_path)
+                metrics.count("convert", 1, stat.st_size)
+                for label, output_path, ffmpeg_args, _ in outputs:
+                    manifests[label]["files"][rel_path] = {
+                        "source": rel_path,
+                        "size": stat.st_size,
+                        "mtime_ns": stat.st_mtime_ns,
+                        "sha256": sha256,
+                        "output": os.path.relpath(output_path, trees[label]),
+                        "ffmpeg_args": ffmpeg_args,
+                    }
+                print(f"[{done}/{len(futures)}] Converted {m4a_path} to {', '.join(path for _, path, _, _ in outputs)}")
+            else:
+                for label, _, _, _ in outputs:
+                    manifests[label]["files"].pop(rel_path, None)
+                failed.append(m4a_path)
+                print(f"[{done}/{len(futures)}] Error during conversion of {m4a_path}: {error}")
+
+    removed = 0
+    if callable(remove_stale):
+        remove_stale = remove_stale()
+    if not remove_stale:
+        print("Outputs of sources that were not handed over are kept (the input list is incomplete)")
+    with metrics.stage("manifest"):
+        for label, manifest in manifests.items():
+            entries = manifest["files"]
+            for rel_path in sorted(set(entries) - seen) if remove_stale else []:
+                output_path = os.path.join(trees[label], entries.pop(rel_path)["output"])
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                    removed += 1
+                    print(f"Removed {output_path} (source no longer exists)")
+
+            save_manifest(trees[label], manifest)
+
+    print("")
+    print(f"Conversion finished: {converted} converted, {unchanged} unchanged, "
+          f"{removed} removed, {len(failed)} failed ({jobs} parallel jobs, "
+          f"format(s): {', '.join(label for label, _, _ in formats)})")
+    for m4a_path in failed:
+        print(f"  FAILED: {m4a_path}")
+    return converted, len(failed)
+
+
+def get_option(argv, name, default=None):
+    """Return the value following an option like '--jobs 4', or default if it is absent."""
+    if name in argv:
+        index = argv.index(name)
+        if index + 1 < len(argv):
+            return argv[index + 1]
+    return default
 
 
 if __name__ == "__main__":
@@ -51,37 +289,105 @@ if __name__ == "__main__":
     print("CONVERT AUDIO")
     print("=" * 70)
     print("WHAT THIS DOES:")
-    print("  1. Copies the source folder to a destination folder")
-    print("  2. Recursively converts all .m4a files to .mp3 format (using ffmpeg)")
-    print("  3. Deletes all original .m4a files from the destination")
+    print("  1. Recreates the source folder structure in the destination and copies")
+    print("     all files that are not .m4a files")
+    print("  2. Recursively converts all .m4a files to .mp3 (or other formats) using")
+    print("     ffmpeg, reading them from the source and writing into the destination")
+    print("     Files unchanged since the last run into the same destination are")
+    print("     skipped; MP3s whose .m4a source disappeared are removed")
     print("")
     print("PARAMETERS:")
     print("  <source-folder>  (required) Path to folder containing .m4a files")
     print("  <dest-folder>    (required) Destination folder for converted files")
+    print("  [--jobs N]       (optional) Number of parallel ffmpeg conversions")
+    print("                    (default: number of CPU cores)")
+    print("  [--formats LIST] (optional) Output formats, e.g. 'mp3,opus:64k' (default: mp3)")
+    print("  [--hash]         (optional) Also compare content hashes to detect")
+    print("                    unchanged files")
+    print("  [--link]         (optional) Hard-link non-audio files instead of copying")
+    print("  [--index FILE]   (optional) Scan index that speeds up repeated scans")
+    print("  [--metrics FILE] (optional) Write per-stage timings and resource use as JSON")
+    print("  [--profile FILE] (optional) Write a cProfile dump of the run")
     print("")
     
     if len(sys.argv) < 3:
         print("ERROR: Missing required parameters")
         print("")
         print("USAGE:")
-        print("  python3 convert-audio.py <source-folder> <dest-folder>")
+        print("  python3 convert-audio.py <source-folder> <dest-folder> [--jobs N] [--formats LIST] [--hash] [--link]")
+        print("                           [--index FILE] [--metrics FILE] [--profile FILE]")
         print("")
         print("EXAMPLE:")
         print("  python3 convert-audio.py data/original data/converted")
-        print("  python3 convert-audio.py /path/to/source /path/to/destination")
+        print("  python3 convert-audio.py /path/to/source /path/to/destination --jobs 8")
+        print("  python3 convert-audio.py data/original data/converted --formats mp3,opus")
         print("")
         print("PARAMETER EXPLANATION:")
         print("  <source-folder>: Must be a path to an existing directory containing")
         print("                   .m4a audio files to convert.")
         print("                   Can be relative (e.g., 'data/original') or absolute.")
         print("")
-        print("  <dest-folder>:  Destination folder where files will be copied and")
-        print("                   converted. Will be created if it doesn't exist.")
+        print("  <dest-folder>:  Destination folder that receives the converted .mp3 files")
+        print("                   and copies of all other files. Will be created if it")
+        print("                   doesn't exist.")
         print("                   Can be relative (e.g., 'data/converted') or absolute.")
+        print("")
+        print("  [--jobs N]:     (optional) How many files are converted at the same time.")
+        print("                   Defaults to the number of CPU cores.")
+        print("")
+        print(f"  [--formats LIST]: (optional) Comma-separated output formats: {', '.join(FORMATS)}.")
+        print("                   Add ':BITRATE' to change the quality (e.g., 'opus:64k').")
+        print("                   Each file is decoded once for all formats. With more than")
+        print("                   one format, each gets its own folder in <dest-folder>")
+        print("                   (e.g., 'mp3' and 'opus').")
+        print("")
+        print("  [--hash]:       (optional) Compare file contents (SHA-256) in addition to")
+        print("                   size and modification time when deciding whether a")
+        print("                   file changed since the last run.")
+        print("")
+        print("  [--link]:       (optional) Hard-link files that are not converted instead")
+        print("                   of copying them (falls back to copying if the")
+        print("                   destination is on another drive).")
+        print("")
+        print("  [--index FILE]: (optional) File in which folder listings are remembered")
+        print("                   (created if it doesn't exist). Later runs only re-read")
+        print("                   folders that changed, which helps on very large trees.")
+        print("")
+        print("  [--metrics FILE]: (optional) Write the time, CPU time, file and byte counts,")
+        print("                   ffmpeg time and peak memory of every stage to a JSON file.")
+        print("")
+        print("  [--profile FILE]: (optional) Profile the run (all threads) and write the")
+        print("                   cProfile statistics to FILE (view: python3 -m pstats FILE).")
         sys.exit(1)
     
     source_folder = sys.argv[1]
     destination_folder = sys.argv[2]
+    jobs = get_option(sys.argv, "--jobs", str(os.cpu_count() or 1))
+    format_list = get_option(sys.argv, "--formats", "mp3")
+    use_hash = "--hash" in sys.argv
+    link = "--link" in sys.argv
+    index_path = get_option(sys.argv, "--index")
+    metrics_path = get_option(sys.argv, "--metrics")
+    profile_path = get_option(sys.argv, "--profile")
+    
+    # Validate job count
+    if not jobs.isdigit() or int(jobs) < 1:
+        print(f"ERROR: '--jobs {jobs}' is not a valid number of parallel jobs.")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print("  [--jobs N]:     Must be a positive whole number (e.g., '--jobs 4').")
+        sys.exit(1)
+    jobs = int(jobs)
+    
+    # Validate output formats
+    try:
+        formats = parse_formats(format_list)
+    except ValueError as e:
+        print(f"ERROR: '--formats {format_list}': {e}.")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print(f"  [--formats LIST]: Comma-separated list of {', '.join(FORMATS)} (e.g., '--formats mp3,opus').")
+        sys.exit(1)
     
     # Validate source folder
     if not os.path.isdir(source_folder):
@@ -95,9 +401,23 @@ if __name__ == "__main__":
     
     print(f"Source folder: {source_folder}")
     print(f"Destination folder: {destination_folder}")
+    print(f"Parallel jobs: {jobs}")
+    for label, folder in format_trees(destination_folder, formats).items():
+        print(f"Format {label}: {folder}")
+    print(f"Compare content hashes: {use_hash}")
+    print(f"Hard-link other files: {link}")
+    print(f"Scan index: {index_path or '(none)'}")
     print("=" * 70)
     print("")
     
-    copy_folder(source_folder, destination_folder)
-    convert_m4a_to_mp3(destination_folder)
-    delete_m4a_files(destination_folder)
+    index = ScanIndex(index_path) if index_path else None
+    try:
+        with collect_metrics("convert-audio", metrics_path, profile_path):
+            for folder in format_trees(destination_folder, formats).values():
+                mirror_other_files(source_folder, folder, link, index)
+            converted, failed = convert_m4a_to_mp3(source_folder, destination_folder, jobs, use_hash, index, formats)
+    finally:
+        if index:
+            index.close()
+    if failed:
+        sys.exit(1)
@@ -2,6 +2,24 @@ import os
 import shutil
 import sys
 import re
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from folder_scan import ScanIndex, file_hash, walk_folder
+from run_metrics import collect_metrics, metrics
+from job_control import submit
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FICLONE = 0x40049409  # Linux ioctl that clones a file's extents (copy-on-write)
+MANIFEST_NAME = ".flatten-manifest.json"  # names of the files the tool wrote into the destination
+PROGRESS_INTERVAL = 1.0  # seconds between progress lines
+LINK_MODES = ("hard", "sym", "reflink")
+METHOD_LABELS = {"copy": "copied", "hard": "hard-linked", "sym": "symlinked", "reflink": "reflinked",
+                 "unchanged": "unchanged"}
 
 def pad_all_numbers(text):
     """
@@ -18,16 +36,13 @@ def normalize_filename(filename):
     name, ext = os.path.splitext(filename)
     return f"{pad_all_numbers(name)}{ext}"
 
-def copy_and_rename_files(source_folder, destination_folder):
-    """Flatten directory structure into destination folder, normalizing names and preserving total order."""
-    if not os.path.exists(destination_folder):
-        os.makedirs(destination_folder)
-
-    for root, dirs, files in os.walk(source_folder):
-        # Normalize and sort folders and files
-        dirs[:] = sorted(dirs, key=pad_all_numbers)
-        files = sorted(files, key=pad_all_numbers)
-
+def plan_copies(source_folder, destination_folder, index=None):
+    """
+    Return (source path, destination path) pairs for all files, in flattened order.
+    Folders and files are visited in natural order; an optional ScanIndex speeds up re-scans.
+    """
+    copies = []
+    for root, dirs, files in walk_folder(source_folder, index):
         for file in files:
             # Special case: Recording.m4a becomes Recording0001.m4a
             normalized_file = normalize_filename("Recording0001.m4a" if file == "Recording.m4a" else file)
@@ -39,9 +54,180 @@ def copy_and_rename_files(source_folder, destination_folder):
 
             old_file_path = os.path.join(root, file)
             new_file_path = os.path.join(destination_folder, new_file_name)
+            copies.append((old_file_path, new_file_path))
+    return copies
+
+def reflink_file(old_file_path, new_file_path):
+    """Create a copy-on-write clone of a file (Linux FICLONE). Raises OSError if unsupported."""
+    if fcntl is None:
+        raise OSError("reflinks are not supported on this platform")
+    with open(old_file_path, "rb") as src, open(new_file_path, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(new_file_path)
+            raise
+    shutil.copystat(old_file_path, new_file_path)
 
-            shutil.copy(old_file_path, new_file_path)
-            print(f"Copied: {old_file_path} -> {new_file_path}")
+def find_collisions(copies):
+    """Return {destination path: [source paths]} for destinations claimed by more than one file."""
+    sources_by_target = {}
+    for old_file_path, new_file_path in copies:
+        sources_by_target.setdefault(os.path.normcase(new_file_path), []).append(old_file_path)
+    return {target: sources for target, sources in sources_by_target.items() if len(sources) > 1}
+
+def load_manifest(directory):
+    """Load the manifest of the files earlier runs wrote into a destination folder, or an empty one."""
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    try:
+        with open(manifest_path, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+    except FileNotFoundError:
+        return {"files": []}
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable manifest {manifest_path}: {e}")
+        return {"files": []}
+    manifest.setdefault("files", [])
+    return manifest
+
+def save_manifest(directory, manifest):
+    """Write the manifest atomically into the destination folder."""
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+def is_up_to_date(old_file_path, new_file_path, link=None, use_hash=False):
+    """
+    Check whether the destination already holds the result of transferring the source:
+    the same symlink target, the same hard-linked file, or a file with equal size and
+    mtime (or, with use_hash, equal size and content). With link='hard', a copy only
+    counts where no hard link is possible (source and destination on different drives).
+    """
+    if link == "sym":
+        return os.path.islink(new_file_path) and os.readlink(new_file_path) == os.path.abspath(old_file_path)
+    if not os.path.isfile(new_file_path) or os.path.islink(new_file_path):
+        return False
+    old_stat = os.stat(old_file_path)
+    new_stat = os.stat(new_file_path)
+    if os.path.samestat(old_stat, new_stat):
+        return True
+    if link == "hard" and old_stat.st_dev == new_stat.st_dev:
+        return False  # a copy from an earlier run; replace it with a link
+    if old_stat.st_size != new_stat.st_size:
+        return False
+    if old_stat.st_mtime_ns == new_stat.st_mtime_ns:
+        return True
+    return use_hash and file_hash(old_file_path) == file_hash(new_file_path)
+
+def transfer_file(old_file_path, new_file_path, link=None):
+    """
+    Copy a file, or link it when link is 'hard', 'sym' or 'reflink'.
+    Hard links and reflinks fall back to a normal copy if the file system does not
+    support them (e.g. different drives). Returns the method actually used.
+    """
+    if os.path.lexists(new_file_path):
+        os.remove(new_file_path)
+    if link == "sym":
+        os.symlink(os.path.abspath(old_file_path), new_file_path)
+        return "sym"
+    if link in ("hard", "reflink"):
+        try:
+            if link == "hard":
+                os.link(old_file_path, new_file_path)
+            else:
+                reflink_file(old_file_path, new_file_path)
+            return link
+        except OSError:
+            pass
+    shutil.copy2(old_file_path, new_file_path)
+    return "copy"
+
+def flatten_file(old_file_path, new_file_path, link=None, sync=False, use_hash=False):
+    """Transfer one file; with sync, skip it if the destination is up to date. Returns the method used."""
+    if sync and is_up_to_date(old_file_path, new_file_path, link, use_hash):
+        return "unchanged"
+    return transfer_file(old_file_path, new_file_path, link)
+
+def copy_and_rename_files(source_folder, destination_folder, jobs=1, link=None, sync=False, use_hash=False,
+                          index=None):
+    """
+    Flatten directory structure into destination folder, normalizing names and preserving total order.
+    All target names are planned first; if two files would get the same name nothing is copied.
+    Files are transferred on up to `jobs` threads; progress is printed at most once per second.
+    With sync, files already up to date are skipped and files that an earlier run wrote
+    into the destination but that are no longer produced by the source are removed.
+    A manifest in the destination, only written with sync, records the files written,
+    so files the tool did not write are never removed.
+    With an index (a ScanIndex), unchanged source folders are not listed again.
+    Returns False if the flattening was aborted because of name collisions or if
+    any file could not be transferred.
+    """
+    with metrics.stage("scan"):
+        copies = plan_copies(source_folder, destination_folder, index)
+        collisions = find_collisions(copies)
+    if collisions:
+        print(f"ERROR: {len(collisions)} destination name(s) would be used by more than one file:")
+        for target, sources in sorted(collisions.items()):
+            print(f"  {os.path.basename(target)}")
+            for source in sources:
+                print(f"    <- {source}")
+        print("Nothing was copied. Rename the files so that they are unique after flattening.")
+        return False
+
+    if not os.path.exists(destination_folder):
+        os.makedirs(destination_folder)
+
+    if sync:
+        manifest = load_manifest(destination_folder)
+        with metrics.stage("cleanup"):
+            planned = {os.path.normcase(new) for _, new in copies}
+            for name in sorted(manifest["files"]):
+                path = os.path.join(destination_folder, name)
+                if os.path.normcase(path) not in planned and (os.path.isfile(path) or os.path.islink(path)):
+                    os.remove(path)
+                    print(f"Removed stale file: {path}")
+
+    methods = {}
+    failed = []
+    last_report = time.monotonic()
+    with metrics.stage("transfer"), ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {submit(executor, flatten_file, old, new, link, sync, use_hash): old for old, new in copies}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                method = future.result()
+                methods[method] = methods.get(method, 0) + 1
+                if method != "unchanged":
+                    metrics.count("transfer", 1, os.path.getsize(futures[future]))
+            except OSError as e:
+                failed.append(futures[future])
+                print(f"Error: {futures[future]}: {e}")
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL or done == len(copies):
+                last_report = time.monotonic()
+                print(f"[{done}/{len(copies)}] files flattened")
+
+    if sync:
+        # Files recorded earlier stay recorded while they exist (runs without --sync do not record)
+        written = {os.path.basename(new) for _, new in copies if os.path.lexists(new)}
+        written.update(name for name in manifest["files"] if os.path.lexists(os.path.join(destination_folder, name)))
+        manifest["files"] = sorted(written)
+        save_manifest(destination_folder, manifest)
+
+    summary = ", ".join(f"{count} {METHOD_LABELS[method]}" for method, count in sorted(methods.items()))
+    print(f"Flattened {len(copies) - len(failed)} file(s) into {destination_folder}: {summary or 'nothing to do'}")
+    if failed:
+        print(f"{len(failed)} file(s) failed")
+    return not failed
+
+def get_option(argv, name, default=None):
+    """Return the value following an option like '--jobs 4', or default if it is absent."""
+    if name in argv:
+        index = argv.index(name)
+        if index + 1 < len(argv):
+            return argv[index + 1]
+    return default
 
 if __name__ == "__main__":
     print("=" * 70)
@@ -57,13 +243,22 @@ if __name__ == "__main__":
     print("PARAMETERS:")
     print("  <source-folder>  (required) Path to folder to flatten")
     print("  <dest-folder>    (required) Destination folder for flattened files")
+    print("  [--jobs N]       (optional) Number of files copied in parallel")
+    print("                    (default: number of CPU cores)")
+    print("  [--link MODE]    (optional) 'hard', 'sym' or 'reflink' instead of copying")
+    print("  [--sync]         (optional) Skip unchanged files, remove stale ones")
+    print("  [--hash]         (optional) With --sync, also compare file contents")
+    print("  [--index FILE]   (optional) Scan index that speeds up repeated scans")
+    print("  [--metrics FILE] (optional) Write per-stage timings and resource use as JSON")
+    print("  [--profile FILE] (optional) Write a cProfile dump of the run")
     print("")
     
     if len(sys.argv) < 3:
         print("ERROR: Missing required parameters")
         print("")
         print("USAGE:")
-        print("  python3 flatten-folder.py <source-folder> <dest-folder>")
+        print("  python3 flatten-folder.py <source-folder> <dest-folder> [--jobs N] [--link hard|sym|reflink] [--sync [--hash]]")
+        print("                            [--index FILE] [--metrics FILE] [--profile FILE]")
         print("")
         print("EXAMPLE:")
         print("  python3 flatten-folder.py data/my-nested-folder data/flattened")
@@ -77,10 +272,59 @@ if __name__ == "__main__":
         print("  <dest-folder>:  Destination folder where flattened files will be saved.")
         print("                   Will be created if it doesn't exist.")
         print("                   Can be relative (e.g., 'data/flattened') or absolute.")
+        print("")
+        print("  [--jobs N]:     (optional) How many files are copied at the same time.")
+        print("                   Defaults to the number of CPU cores.")
+        print("")
+        print("  [--link MODE]:  (optional) Do not duplicate the file contents:")
+        print("                   'hard'    - hard links (same drive only, falls back to copy)")
+        print("                   'sym'     - symbolic links pointing to the source files")
+        print("                   'reflink' - copy-on-write clones (Btrfs, XFS; falls back")
+        print("                               to copy)")
+        print("")
+        print("  [--sync]:       (optional) Only copy files that are new or changed (by size")
+        print("                   and modification time) and delete files that earlier --sync")
+        print("                   runs wrote into the destination folder but that no longer")
+        print("                   exist in the source. Other files are never deleted.")
+        print("")
+        print("  [--hash]:       (optional) With --sync, files whose size matches but whose")
+        print("                   modification time differs are compared by content.")
+        print("")
+        print("  [--index FILE]: (optional) File in which folder listings are remembered")
+        print("                   (created if it doesn't exist). Later runs only re-read")
+        print("                   folders that changed, which helps on very large trees.")
+        print("")
+        print("  [--metrics FILE]: (optional) Write the time, CPU time, file and byte counts,")
+        print("                   ffmpeg time and peak memory of every stage to a JSON file.")
+        print("")
+        print("  [--profile FILE]: (optional) Profile the run (all threads) and write the")
+        print("                   cProfile statistics to FILE (view: python3 -m pstats FILE).")
         sys.exit(1)
 
     source_folder = sys.argv[1]
     destination_folder = sys.argv[2]
+    jobs = get_option(sys.argv, "--jobs", str(os.cpu_count() or 1))
+    link = get_option(sys.argv, "--link")
+    sync = "--sync" in sys.argv
+    use_hash = "--hash" in sys.argv
+    index_path = get_option(sys.argv, "--index")
+    metrics_path = get_option(sys.argv, "--metrics")
+    profile_path = get_option(sys.argv, "--profile")
+
+    if not jobs.isdigit() or int(jobs) < 1:
+        print(f"ERROR: '--jobs {jobs}' is not a valid number of parallel jobs.")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print("  [--jobs N]:     Must be a positive whole number (e.g., '--jobs 4').")
+        sys.exit(1)
+    jobs = int(jobs)
+
+    if link is not None and link not in LINK_MODES:
+        print(f"ERROR: '--link {link}' is not a known link mode.")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print("  [--link MODE]:  Must be 'hard', 'sym' or 'reflink'.")
+        sys.exit(1)
 
     if not os.path.isdir(source_folder):
         print(f"ERROR: '{source_folder}' is not a valid directory.")
@@ -92,7 +336,19 @@ if __name__ == "__main__":
 
     print(f"Source folder: {source_folder}")
     print(f"Output folder: {destination_folder}")
+    print(f"Parallel jobs: {jobs}")
+    print(f"Link mode: {link or 'copy'}")
+    print(f"Sync mode: {sync}")
+    print(f"Scan index: {index_path or '(none)'}")
     print("=" * 70)
     print("")
 
-    copy_and_rename_files(source_folder, destination_folder)
+    index = ScanIndex(index_path) if index_path else None
+    try:
+        with collect_metrics("flatten-folder", metrics_path, profile_path):
+            flattened = copy_and_rename_files(source_folder, destination_folder, jobs, link, sync, use_hash, index)
+    finally:
+        if index:
+            index.close()
+    if not flattened:
+        sys.exit(1)
@@ -0,0 +1,143 @@
+"""
+Shared folder scanning for the tools: directory listings via os.scandir, one
+natural sort order for folders and files, an optional on-disk index that
+lets repeat scans of large trees skip reading folders that have not changed, and
+the content hash the tools use to recognise unchanged or identical files.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+AUDIO_EXTENSION = ".m4a"
+NUMBER_PATTERN = re.compile(r'(\d+)')
+NUMBERED_PATTERN = re.compile(r'^\d|\(\d+\)')  # a leading or bracketed number, as in '0003-Intro', 'audio (3)'
+HASH_CHUNK_SIZE = 1024 * 1024
+RACY_WINDOW_NS = 2 * 10**9  # folders changed this recently are not cached (coarse file system timestamps)
+
+
+def natural_key(name):
+    """
+    Sort key that orders numbers by value: 'audio (2).m4a' before 'audio (10).m4a',
+    'Scene3' before 'Scene12'. Ties (e.g. '3' and '003') are broken by the name itself.
+    """
+    parts = NUMBER_PATTERN.split(name)
+    parts[1::2] = [int(number) for number in parts[1::2]]
+    return parts, name
+
+
+def file_key(name):
+    """
+    Sort key for the files of a folder: like natural_key, but names without a leading
+    or bracketed number come first ('audio.m4a' before 'audio (1).m4a'), as they
+    always have in the pairing of generate-cards.py.
+    """
+    return NUMBERED_PATTERN.search(name) is not None, natural_key(name)
+
+
+class ScanIndex:
+    """
+    SQLite index of folder listings, keyed by folder path and modification time.
+    A folder's modification time changes whenever an entry is added, removed or
+    renamed, so an unchanged folder costs one stat instead of a full listing.
+    """
+
+    def __init__(self, db_path):
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS folders (path TEXT PRIMARY KEY, mtime_ns INTEGER, listing TEXT)"
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, folder_path, mtime_ns):
+        """Return the cached (folders, files) of a folder, or None if it changed since it was indexed."""
+        row = self.connection.execute(
+            "SELECT mtime_ns, listing FROM folders WHERE path = ?", (folder_path,)
+        ).fetchone()
+        if row is None or row[0] != mtime_ns:
+            self.misses += 1
+            return None
+        self.hits += 1
+        listing = json.loads(row[1])
+        return listing["dirs"], listing["files"]
+
+    def store(self, folder_path, mtime_ns, dirs, files):
+        """Remember the listing of a folder, unless it was modified too recently to be trusted."""
+        if time.time_ns() - mtime_ns < RACY_WINDOW_NS:
+            return
+        self.connection.execute(
+            "INSERT OR REPLACE INTO folders (path, mtime_ns, listing) VALUES (?, ?, ?)",
+            (folder_path, mtime_ns, json.dumps({"dirs": dirs, "files": files})),
+        )
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def list_folder(folder_path, index=None):
+    """
+    Return (subfolder names, file names) of a folder, in natural order (files: file_key).
+    With an index, the listing is reused if the folder has not changed since the last scan.
+    """
+    mtime_ns = None
+    if index is not None:
+        mtime_ns = os.stat(folder_path).st_mtime_ns
+        cached = index.lookup(os.path.abspath(folder_path), mtime_ns)
+        if cached is not None:
+            dirs, files = cached
+            # Sorted again, as indexes written by older versions may hold another order
+            dirs.sort(key=natural_key)
+            files.sort(key=file_key)
+            return dirs, files
+
+    dirs, files = [], []
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                dirs.append(entry.name)
+            else:
+                files.append(entry.name)
+    dirs.sort(key=natural_key)
+    files.sort(key=file_key)
+
+    if index is not None:
+        index.store(os.path.abspath(folder_path), mtime_ns, dirs, files)
+    return dirs, files
+
+
+def walk_folder(root, index=None):
+    """
+    Yield (folder path, subfolder names, file names) for root and everything below it,
+    top-down and in natural order, like os.walk. Symbolic links to folders are not followed.
+    """
+    dirs, files = list_folder(root, index)
+    yield root, dirs, files
+    for name in dirs:
+        path = os.path.join(root, name)
+        if not os.path.islink(path):
+            yield from walk_folder(path, index)
+
+
+def list_audio_files(folder_path, index=None):
+    """Return the names of the audio files directly in a folder, in file_key order."""
+    return [name for name in list_folder(folder_path, index)[1] if name.endswith(AUDIO_EXTENSION)]
+
+
+def file_hash(path):
+    """Return the SHA-256 hex digest of a file's content, read in HASH_CHUNK_SIZE chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -3,25 +3,240 @@ import json
 import uuid
 import shutil
 from datetime import datetime
-import re
 import zipfile
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from folder_scan import AUDIO_EXTENSION, file_hash, list_audio_files, list_folder
+from audio_probe import preflight
+from run_metrics import collect_metrics, metrics
+from job_control import check_cancelled, submit
+from silence_split import DEFAULT_MIN_SILENCE, DEFAULT_SILENCE_DB, split_takes
+from audio_dsp import require_numpy
 
+# Already-compressed audio gains nothing from deflate, so it is stored as-is
+STORED_EXTENSIONS = ('.m4a', '.mp3', '.mp4', '.aac', '.ogg', '.opus', '.flac')
+ZIP_COPY_SIZE = 1024 * 1024  # bytes of stored audio copied into the archive at a time
 
-def create_directory(path, meta_info):
+# Namespace for the UUIDv5 identifiers of --deterministic runs; never change it,
+# or every deterministic ID changes
+DETERMINISTIC_NAMESPACE = uuid.UUID("6f1c2a4e-93d5-5b8e-9c0f-7a4d2e6b1f38")
+
+
+class IdGenerator:
+    """
+    Hands out the IDs of directories, cards and audio files.
+    By default every ID is a random UUID4. In deterministic mode IDs are UUIDv5
+    values derived from the relative output path and, for audio files, the
+    content hash, so an unchanged input keeps its ID across runs. Hashes are
+    cached by path, size and mtime in hash_cache.
+    """
+
+    def __init__(self, deterministic=False, hash_cache=None):
+        self.deterministic = deterministic
+        self.hash_cache = hash_cache if hash_cache is not None else {}
+
+    def _derive(self, name):
+        if self.deterministic:
+            return str(uuid.uuid5(DETERMINISTIC_NAMESPACE, name))
+        return str(uuid.uuid4())
+
+    def directory(self, name, parent=""):
+        return self._derive(f"dir:{parent}/{name}")
+
+    def card(self, dir_path, card_name):
+        return self._derive(f"card:{dir_path}/{card_name}")
+
+    def audio(self, card_uuid, slot, source_path):
+        if source_path is None:
+            return self._derive(f"audio:{card_uuid}/{slot}")
+        if not self.deterministic:
+            return self._derive("")
+        return self._derive(f"audio:{card_uuid}/{os.path.basename(source_path)}:{self.content_hash(source_path)}")
+
+    def content_hash(self, path):
+        """Return the SHA-256 of a file, reusing the cached value while size and mtime match."""
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        cached = self.hash_cache.get(key)
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+        sha256 = file_hash(path)
+        self.hash_cache[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+        return sha256
+
+
+class FolderOutput:
+    """
+    Writes the card structure into a folder on disk. Paths are relative to that folder.
+    Files whose content would not change are left untouched; with remove_stale=True,
+    close() deletes everything in the folder that was not written in this run, unless
+    the run did not complete (a failed or cancelled run would remove valid cards).
+    With digests ({source path: content hash}), audio content is stored once: every
+    further file with the same content is a hard link to the first copy.
+    """
+
+    def __init__(self, root, remove_stale=False, digests=None):
+        self.root = root
+        self.remove_stale = remove_stale
+        self.digests = digests
+        self.stored = {}  # content hash -> (path of the stored copy, Event set once it is written)
+        self.written = set()
+        self.lock = threading.Lock()
+        self.changed = 0
+        self.unchanged = 0
+        self.linked = 0
+        self.linked_bytes = 0
+        self.not_linked = 0
+
+    def _track(self, rel_path, changed):
+        with self.lock:
+            self.written.add(os.path.normpath(rel_path))
+            if changed:
+                self.changed += 1
+            else:
+                self.unchanged += 1
+
+    def make_dir(self, rel_path):
+        os.makedirs(os.path.join(self.root, rel_path), exist_ok=True)
+        with self.lock:
+            self.written.add(os.path.normpath(rel_path))
+
+    def write_json(self, rel_path, data):
+        path = os.path.join(self.root, rel_path)
+        content = json.dumps(data)
+        try:
+            with open(path, "r") as meta_file:
+                if meta_file.read() == content:
+                    self._track(rel_path, False)
+                    return
+        except (FileNotFoundError, UnicodeDecodeError):
+            pass
+        with open(path, "w") as meta_file:
+            meta_file.write(content)
+        self._track(rel_path, True)
+
+    def copy_file(self, source_path, rel_path):
+        digest = self.digests.get(source_path) if self.digests else None
+        if digest is None:
+            self._copy(source_path, rel_path)
+            return
+        with self.lock:
+            first = digest not in self.stored
+            if first:
+                self.stored[digest] = (rel_path, threading.Event())
+        stored_path, written = self.stored[digest]
+        if first:
+            try:
+                self._copy(source_path, rel_path)
+            finally:
+                written.set()
+        else:
+            written.wait()
+            self._link(source_path, rel_path, stored_path)
+
+    def _copy(self, source_path, rel_path):
+        path = os.path.join(self.root, rel_path)
+        # Audio file names carry their ID, so same name and size means same content
+        # in deterministic mode; random IDs never match an existing file
+        if os.path.exists(path) and os.path.getsize(path) == os.path.getsize(source_path):
+            self._track(rel_path, False)
+            return
+        if os.path.exists(path):
+            os.remove(path)  # may be a hard link; writing into it would change the other cards too
+        shutil.copyfile(source_path, path)
+        self._track(rel_path, True)
+
+    def _link(self, source_path, rel_path, stored_rel_path):
+        """Write a duplicate as a hard link to the stored copy, or as a copy where the drive has no hard links."""
+        path = os.path.join(self.root, rel_path)
+        stored_path = os.path.join(self.root, stored_rel_path)
+        size = os.path.getsize(source_path)
+        if os.path.exists(path) and os.path.exists(stored_path) and os.path.samefile(path, stored_path):
+            changed = False
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            try:
+                os.link(stored_path, path)
+            except OSError:
+                shutil.copyfile(source_path, path)
+                with self.lock:
+                    self.not_linked += 1
+                self._track(rel_path, True)
+                return
+            changed = True
+        with self.lock:
+            self.linked += 1
+            self.linked_bytes += size
+        self._track(rel_path, changed)
+
+    def close(self, complete=True):
+        removed = 0
+        if self.remove_stale and not complete:
+            print("Stale files are kept: the cards were not all written")
+        elif self.remove_stale:
+            for root, dirs, files in os.walk(self.root, topdown=False):
+                for name in files + dirs:
+                    path = os.path.join(root, name)
+                    if os.path.normpath(os.path.relpath(path, self.root)) in self.written:
+                        continue
+                    if os.path.isdir(path) and not os.path.islink(path):
+                        shutil.rmtree(path)
+                    else:
+                        os.remove(path)
+                    removed += 1
+        print(f"Card folder: {self.changed} file(s) written, {self.unchanged} unchanged, {removed} stale removed")
+        if self.digests is not None:
+            print(f"Deduplication: {len(self.digests)} audio file(s), {len(self.stored)} unique stored, "
+                  f"{self.linked} hard-linked ({self.linked_bytes:,} bytes saved)")
+            if self.not_linked:
+                print(f"  {self.not_linked} duplicate(s) copied: the output drive does not support hard links")
+
+
+class ZipOutput:
+    """
+    Streams the card structure straight into a zip archive, reading each audio file
+    once from its source, so no staging folder is written. Paths are archive names.
+    """
+
+    def __init__(self, zip_path):
+        self.zipf = zipfile.ZipFile(zip_path, 'w')
+        self.lock = threading.Lock()  # ZipFile does not support concurrent writers
+
+    def make_dir(self, rel_path):
+        pass  # Like zip_folder, the archive only contains file entries
+
+    def write_json(self, rel_path, data):
+        with self.lock:
+            self.zipf.writestr(rel_path, json.dumps(data), compress_type=compress_type_for(rel_path))
+
+    def copy_file(self, source_path, rel_path):
+        with self.lock:
+            self.zipf.write(source_path, rel_path, compress_type=compress_type_for(rel_path))
+
+    def close(self, complete=True):
+        self.zipf.close()
+        print_compression_report(self.zipf.infolist())
+
+
+def create_directory(output, path, meta_info):
     """Create a directory and its directory.meta file."""
-    os.makedirs(path, exist_ok=True)
+    output.make_dir(path)
     meta_path = os.path.join(path, "directory.meta")
-    with open(meta_path, "w") as meta_file:
-        json.dump(meta_info, meta_file)
+    with metrics.task("meta"):
+        output.write_json(meta_path, meta_info)
+    metrics.count("meta", 1)
 
-def copy_and_rename_audio_files(source_paths, destination_dir, uuids):
+def copy_and_rename_audio_files(output, source_paths, destination_dir, uuids):
     """Copy and rename audio files to the destination directory with UUID names."""
     for original_path, uuid_name in zip(source_paths, uuids):
         new_path = os.path.join(destination_dir, f"{uuid_name}.m4a")
-        shutil.copyfile(original_path, new_path)
+        with metrics.task("audio"):
+            output.copy_file(original_path, new_path)
+        metrics.count("audio", 1, os.path.getsize(original_path))
 
-def generate_card_meta(card_dir_path, card_name, card_uuid, base_timestamp, audio_uuids, pair_index):
+def generate_card_meta(output, card_dir_path, card_name, card_uuid, base_timestamp, audio_uuids, pair_index):
     """Generate and save a card.meta file."""
     card_meta = {
         "name": card_name,
@@ -30,96 +245,292 @@ def generate_card_meta(card_dir_path, card_name, card_uuid, base_timestamp, audi
         "order": audio_uuids
     }
     meta_path = os.path.join(card_dir_path, "card.meta")
-    with open(meta_path, "w") as meta_file:
-        json.dump(card_meta, meta_file)
+    with metrics.task("meta"):
+        output.write_json(meta_path, card_meta)
+    metrics.count("meta", 1)
 
-def process_audio_files(subdir_path, destination_dir, base_timestamp):
-    """Process all audio files in a subdirectory, creating card folders and meta files."""
-    audio_files = sorted(f for f in os.listdir(subdir_path) if f.endswith('.m4a'))
-    if len(audio_files) % 2 != 0:
-        audio_files.append(None)  # Ensure even number of files for pairing
+def write_card(output, card_dir_path, card_name, card_uuid, base_timestamp, source_paths, audio_uuids, pair_index):
+    """Create one card folder with its renamed audio files and card.meta."""
+    output.make_dir(card_dir_path)
+    copy_and_rename_audio_files(output, source_paths, card_dir_path, audio_uuids)
+    generate_card_meta(output, card_dir_path, card_name, card_uuid, base_timestamp, audio_uuids, pair_index)
 
-    audio_files = sorted(audio_files, key=extract_number)
+def list_audio_paths(subdir_path):
+    """Return the paths of the audio files in a folder, in card order."""
+    return [os.path.join(subdir_path, f) for f in list_audio_files(subdir_path)]
+
+def process_audio_files(output, ids, subdir_path, destination_dir, base_timestamp, executor=None, audio_paths=None):
+    """
+    Process all audio files in a subdirectory, creating card folders and meta files.
+    If audio_paths is given (already in card order), it is used instead of listing subdir_path.
+    If an executor is given, the cards are written on it and their futures are returned.
+    """
+    if audio_paths is None:
+        audio_paths = list_audio_paths(subdir_path)
+    audio_paths = list(audio_paths)
 
-    for i in range(0, len(audio_files), 2):
-        card_uuid = str(uuid.uuid4())
+    if len(audio_paths) % 2 != 0:
+        audio_paths.append(None)  # Ensure even number of files for pairing
+
+    futures = []
+    for i in range(0, len(audio_paths), 2):
+        card_name = f"C-{i//2 + 1:04d}"
+        card_uuid = ids.card(destination_dir, card_name)
         card_dir_path = os.path.join(destination_dir, card_uuid + '-[]')
-        os.makedirs(card_dir_path, exist_ok=True)
 
-        audio_uuids = [str(uuid.uuid4()), str(uuid.uuid4())]
-        source_paths = [os.path.join(subdir_path, audio_files[i]) if audio_files[i] else "",
-                        os.path.join(subdir_path, audio_files[i+1]) if audio_files[i+1] else ""]
+        source_paths = [audio_paths[i] or "", audio_paths[i+1] or ""]
+        audio_uuids = [ids.audio(card_uuid, slot, path or None) for slot, path in enumerate(source_paths)]
         source_paths = [path for path in source_paths if path]  # Filter out empty paths
 
-        copy_and_rename_audio_files(source_paths, card_dir_path, audio_uuids)
-        generate_card_meta(card_dir_path, f"C-{i//2 + 1:04d}", card_uuid, base_timestamp, audio_uuids, i)
+        card_args = (output, card_dir_path, card_name, card_uuid, base_timestamp, source_paths, audio_uuids, i)
+        if executor:
+            futures.append(submit(executor, write_card, *card_args))
+        else:
+            check_cancelled()
+            write_card(*card_args)
+    return futures
 
-def extract_number(filename):
-    """
-    Extracts two numbers from a filename:
-    - A leading number (e.g., '0003-Szene...')
-    - A number in parentheses (e.g., '(0002)')
-    
-    Returns a tuple (leading_number, inner_number), defaulting to 0 if not found.
-    This allows consistent and safe sorting.
-    """
-    # Try to find a number at the start of the filename
-    match1 = re.match(r'(\d+)', filename)
-    top_number = int(match1.group(1)) if match1 else 0
+def process_subdirectory(output, ids, parent_uuid, name, subdir_path, base_timestamp, executor=None, audio_paths=None):
+    """Create the directory for one source folder and process its audio files into cards."""
+    sub_dir_uuid = ids.directory(name, parent_uuid)
+    sub_dir_path = sub_dir_uuid + '-*'
+    create_directory(output, sub_dir_path, {"name": name, "id": sub_dir_uuid + '-*'})
+    return process_audio_files(output, ids, subdir_path, sub_dir_path, base_timestamp, executor, audio_paths)
 
-    # Try to find a number in parentheses
-    match2 = re.search(r'\((\d+)\)', filename)
-    inner_number = int(match2.group(1)) if match2 else 0
+def load_manifest(manifest_path):
+    """Load the manifest of a deterministic run, or an empty one."""
+    try:
+        with open(manifest_path, "r") as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable manifest {manifest_path}: {e}")
+        return {}
 
-    return (top_number, inner_number)
+def save_manifest(manifest_path, manifest):
+    """Write the manifest of a deterministic run atomically."""
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
 
+def hash_audio_files(ids, audio_paths, jobs=1):
+    """
+    Return {path: content hash} of the audio files, hashed on up to `jobs` threads.
+    Hashes are cached in ids (and with it in the manifest of deterministic runs).
+    """
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [submit(executor, ids.content_hash, path) for path in audio_paths]
+        digests = {path: future.result() for path, future in zip(audio_paths, futures)}
+    metrics.count("hash", len(digests), sum(os.path.getsize(path) for path in digests))
+    return digests
 
-def generate_meta_files(source_folder_path, destination_folder_path):
+def check_audio_files(folders, jobs=1, probe_cache=None):
+    """
+    Probe all audio files of the (name, folder path, audio paths) entries with ffprobe
+    before any card is written. Returns False if a file is unreadable or has no audio.
+    """
+    audio_paths = []
+    for _, path, paths in folders:
+        audio_paths.extend(paths if paths is not None else list_audio_paths(path))
+    _, problems = preflight(audio_paths, jobs, probe_cache)
+    return not problems
+
+def generate_meta_files(source_folder_path, destination_folder_path, jobs=1, zip_only=False, deterministic=False,
+                        check=False, probe_cache=None, split=False, silence_db=DEFAULT_SILENCE_DB,
+                        min_silence=DEFAULT_MIN_SILENCE, dedup=False):
+    """
+    Generate the card structure for a source folder and return the path of the
+    generated folder. With zip_only, everything is streamed straight into
+    '<folder>.zip' instead and the folder itself is never written.
+    With jobs > 1, subdirectories are processed and cards are written concurrently
+    on worker pools; the resulting names, order arrays and timestamps are the same.
+    With deterministic, IDs are derived from paths and content hashes and the
+    timestamps of the first run are reused (recorded in '<folder>.manifest.json'),
+    so a re-run only rewrites cards whose inputs changed and removes stale ones.
+    With check, all audio files are probed first (results cached in probe_cache, if
+    given) and nothing is written if any of them is unreadable or empty.
+    With split, every audio file is cut at its silences (quieter than silence_db dBFS
+    for at least min_silence seconds) and each piece becomes a clip of its own.
+    With dedup, audio files with the same content are stored once in the card folder
+    (hard links); see write_card_folders.
+    """
     if not os.path.exists(source_folder_path):
         print("The source folder does not exist.")
         return
 
-    main_dir_uuid = str(uuid.uuid4())
+    folders = []
+    with metrics.stage("scan"):
+        subdir_names, file_names = list_folder(source_folder_path)
+    # ✅ First: process top-level audio files
+    if any(f.endswith(AUDIO_EXTENSION) for f in file_names):
+        folders.append(("_top_level", source_folder_path, None))
+
+    # ✅ Then: process subdirectories (in natural order)
+    for subdir_name in subdir_names:
+        folders.append((subdir_name, os.path.join(source_folder_path, subdir_name), None))
+
+    if check and not check_audio_files(folders, jobs, probe_cache):
+        print("Nothing was written. Fix or remove the files listed above and run again.")
+        return
+
+    source_name = os.path.basename(os.path.normpath(source_folder_path))
+    if not split:
+        return write_card_folders(source_name, folders, destination_folder_path, jobs, zip_only, deterministic,
+                                  dedup)
+
+    # The pieces only live until they are copied into the cards; the folder name is
+    # stable so that deterministic runs see the same piece paths every time
+    split_dir = os.path.join(destination_folder_path, f".split-{source_name}")
+    shutil.rmtree(split_dir, ignore_errors=True)
+    try:
+        with metrics.stage("split"):
+            folders = split_takes(folders, split_dir, jobs, silence_db, min_silence)
+        return write_card_folders(source_name, folders, destination_folder_path, jobs, zip_only, deterministic,
+                                  dedup)
+    finally:
+        shutil.rmtree(split_dir, ignore_errors=True)
+
+def write_card_folders(source_name, folders, destination_folder_path, jobs=1, zip_only=False, deterministic=False,
+                       dedup=False):
+    """
+    Write the card structure for a list of (name, folder path, audio paths) entries
+    and return the path of the generated folder; see generate_meta_files for the options.
+    Entries without audio paths list the .m4a files of their folder.
+    With dedup, all audio files are hashed first and every content is stored once in
+    the card folder; its other occurrences are hard links. Zip entries cannot share
+    data, so the archive still holds every occurrence.
+    """
+    manifest = {}
+    ids = IdGenerator(deterministic)
+    main_dir_uuid = ids.directory(source_name)
     main_dir_path = os.path.join(destination_folder_path, main_dir_uuid + '-*')
-    create_directory(main_dir_path, {"name": os.path.basename(source_folder_path), "id": main_dir_uuid + '-*'})
+    manifest_path = main_dir_path + '.manifest.json'
+    if deterministic:
+        manifest = load_manifest(manifest_path)
+        ids.hash_cache = manifest.get("hashes", {})
 
-    base_timestamp = datetime.now().timestamp() * 1000
+    base_timestamp = manifest.get("base_timestamp") or datetime.now().timestamp() * 1000
 
-    # ✅ First: process top-level audio files
-    top_audio_files = [f for f in os.listdir(source_folder_path) if f.endswith('.m4a')]
-    if top_audio_files:
-        sub_dir_uuid = str(uuid.uuid4())
-        sub_dir_path = os.path.join(main_dir_path, sub_dir_uuid + '-*')
-        create_directory(sub_dir_path, {"name": "_top_level", "id": sub_dir_uuid + '-*'})
-        process_audio_files(source_folder_path, sub_dir_path, base_timestamp)
-
-    # ✅ Then: process subdirectories
-    for subdir_name in os.listdir(source_folder_path):
-        subdir_path = os.path.join(source_folder_path, subdir_name)
-        if os.path.isdir(subdir_path):
-            sub_dir_uuid = str(uuid.uuid4())
-            sub_dir_path = os.path.join(main_dir_path, sub_dir_uuid + '-*')
-            create_directory(sub_dir_path, {"name": subdir_name, "id": sub_dir_uuid + '-*'})
-            process_audio_files(subdir_path, sub_dir_path, base_timestamp)
+    digests = None
+    if dedup and zip_only:
+        print("Note: zip entries cannot share data, so deduplication only applies to card folders")
+    elif dedup:
+        folders = [(name, path, paths if paths is not None else list_audio_paths(path))
+                   for name, path, paths in folders]
+        with metrics.stage("hash"):
+            digests = hash_audio_files(ids, [path for _, _, paths in folders for path in paths], jobs)
+
+    if zip_only:
+        output = ZipOutput(main_dir_path + '.zip')
+    else:
+        output = FolderOutput(main_dir_path, remove_stale=deterministic, digests=digests)
+    with metrics.stage("cards"):
+        write_cards(output, ids, main_dir_uuid, source_name, folders, base_timestamp, jobs)
+
+    if deterministic:
+        with metrics.stage("manifest"):
+            save_manifest(manifest_path, {"base_timestamp": base_timestamp, "hashes": ids.hash_cache})
 
     return main_dir_path
 
+def write_cards(output, ids, main_dir_uuid, source_name, folders, base_timestamp, jobs=1):
+    """
+    Write the main directory and the cards of all folders to output, then close it.
+    The output is told whether every card was written, also when an error ends the run.
+    """
+    complete = False
+    try:
+        create_directory(output, "", {"name": source_name, "id": main_dir_uuid + '-*'})
+
+        if jobs > 1:
+            with ThreadPoolExecutor(max_workers=jobs) as card_executor:
+                with ThreadPoolExecutor(max_workers=jobs) as subdir_executor:
+                    subdir_futures = [
+                        submit(subdir_executor, process_subdirectory, output, ids, main_dir_uuid, name, path,
+                                               base_timestamp, card_executor, audio_paths)
+                        for name, path, audio_paths in folders
+                    ]
+                card_futures = [card for future in subdir_futures for card in future.result()]
+            for future in card_futures:
+                future.result()  # Re-raise errors from the workers
+        else:
+            for name, path, audio_paths in folders:
+                process_subdirectory(output, ids, main_dir_uuid, name, path, base_timestamp, audio_paths=audio_paths)
+        complete = True
+    finally:
+        output.close(complete)
+
+
+def compress_type_for(name):
+    """Store already-compressed audio, deflate everything else (the JSON meta files)."""
+    return zipfile.ZIP_STORED if name.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+
+def print_compression_report(infos):
+    """Print original and compressed bytes of the archive entries, grouped by file type."""
+    totals = {}
+    for info in infos:
+        entry_type = os.path.splitext(info.filename)[1] or info.filename
+        count, size, compressed = totals.get(entry_type, (0, 0, 0))
+        totals[entry_type] = (count + 1, size + info.file_size, compressed + info.compress_size)
+    print("Zip entries by type:")
+    for entry_type, (count, size, compressed) in sorted(totals.items()):
+        method = "stored" if compress_type_for(entry_type) == zipfile.ZIP_STORED else "deflated"
+        print(f"  {entry_type:<16} {count:>6} file(s) {size:>14,} -> {compressed:>14,} bytes "
+              f"({size - compressed:,} saved, {method})")
 
-def zip_folder(folder_path):
+def zip_folder(folder_path, jobs=1):
     """
     Zip the contents of a folder to a zip file with the name of the folder.
+    Audio is stored without compression and streamed into the archive; the small
+    meta files are deflated. With jobs > 1, the meta files among the next `jobs`
+    entries are read ahead in parallel while the archive is written.
     
     :param folder_path: Path to the folder to be zipped
+    :param jobs: Number of entries whose meta files are read ahead
     """
     folder_name = os.path.basename(folder_path)
     zip_name = f"{folder_name}.zip"
     zip_path = os.path.join(os.path.dirname(folder_path), zip_name)
-    
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(folder_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                zipf.write(file_path, os.path.relpath(file_path, folder_path))
+
+    entries = []
+    for root, _, files in os.walk(folder_path):
+        for file in files:
+            file_path = os.path.join(root, file)
+            entries.append((file_path, os.path.relpath(file_path, folder_path)))
+
+    def read_file(file_path):
+        with open(file_path, "rb") as f:
+            return f.read()
+
+    with metrics.stage("zip"), zipfile.ZipFile(zip_path, 'w') as zipf, \
+            ThreadPoolExecutor(max_workers=jobs) as executor:
+        ahead = {}  # entry position -> future of a meta file read ahead
+        for position, (file_path, arcname) in enumerate(entries):
+            check_cancelled()
+            for upcoming in range(position, min(position + jobs, len(entries))):
+                if upcoming not in ahead and compress_type_for(entries[upcoming][1]) != zipfile.ZIP_STORED:
+                    ahead[upcoming] = submit(executor, read_file, entries[upcoming][0])
+            info = zipfile.ZipInfo.from_file(file_path, arcname)
+            info.compress_type = compress_type_for(arcname)
+            if position in ahead:
+                zipf.writestr(info, ahead.pop(position).result())
+            else:
+                # Stored audio gains nothing from being read ahead; stream it instead of holding it in memory
+                with open(file_path, "rb") as source, zipf.open(info, "w") as target:
+                    shutil.copyfileobj(source, target, ZIP_COPY_SIZE)
+    metrics.count("zip", len(entries), sum(info.file_size for info in zipf.infolist()))
+    print_compression_report(zipf.infolist())
+
+
+def get_option(argv, name, default=None):
+    """Return the value following an option like '--jobs 4', or default if it is absent."""
+    if name in argv:
+        index = argv.index(name)
+        if index + 1 < len(argv):
+            return argv[index + 1]
+    return default
 
 
 if __name__ == "__main__":
@@ -138,13 +549,29 @@ if __name__ == "__main__":
     print("  <input-folder>   (required) Path to folder containing .m4a files")
     print("  <output-folder>  (required) Destination folder for generated cards")
     print("  [--no-zip]       (optional) Skip creating zip file")
+    print("  [--jobs N]       (optional) Number of folders/cards written in parallel")
+    print("                    (default: number of CPU cores)")
+    print("  [--zip-only]     (optional) Write only the zip file, streamed directly")
+    print("                    from the input files (no output folder)")
+    print("  [--deterministic] (optional) Stable IDs; re-runs only rewrite changed cards")
+    print("  [--check]        (optional) Stop before writing if any audio file is")
+    print("                    unreadable or empty")
+    print("  [--probe-cache FILE] (optional) Cache of file metadata for faster checks")
+    print("  [--split-silence] (optional) Cut long takes into separate clips at silences")
+    print("  [--silence-db DB] (optional) Level below which audio counts as silence (default: -40)")
+    print("  [--min-silence SECONDS] (optional) Shortest silence that splits (default: 2)")
+    print("  [--dedup]        (optional) Store recordings used in several cards only once")
+    print("  [--metrics FILE] (optional) Write per-stage timings and resource use as JSON")
+    print("  [--profile FILE] (optional) Write a cProfile dump of the run")
     print("")
     
     if len(sys.argv) < 3:
         print("ERROR: Missing required parameters")
         print("")
         print("USAGE:")
-        print("  python3 generate-cards.py <input-folder> <output-folder> [--no-zip]")
+        print("  python3 generate-cards.py <input-folder> <output-folder> [--no-zip | --zip-only] [--jobs N] [--deterministic]")
+        print("                            [--check [--probe-cache FILE]] [--split-silence [--silence-db DB] [--min-silence SECONDS]]")
+        print("                            [--dedup] [--metrics FILE] [--profile FILE]")
         print("")
         print("EXAMPLE:")
         print("  python3 generate-cards.py data/twice-in-a-lifetime data/output")
@@ -161,11 +588,99 @@ if __name__ == "__main__":
         print("")
         print("  [--no-zip]:     (optional) If provided, skip creating zip file.")
         print("                  By default, a zip file is created in the output folder.")
+        print("")
+        print("  [--jobs N]:     (optional) How many folders and cards are written (and")
+        print("                  meta files read while zipping) at the same time. Useful on")
+        print("                  network drives. The generated cards are the same as with")
+        print("                  a single job. Defaults to the number of CPU cores.")
+        print("")
+        print("  [--zip-only]:   (optional) Write the cards straight into the zip file")
+        print("                  without creating the card folder first. Every input file")
+        print("                  is read once and no temporary copy is written.")
+        print("")
+        print("  [--deterministic]: (optional) Derive all IDs from folder names, card")
+        print("                  positions and file contents instead of random UUIDs, and")
+        print("                  keep the timestamps of the first run. Running again into")
+        print("                  the same output folder only rewrites cards whose audio")
+        print("                  changed and removes cards that no longer exist.")
+        print("")
+        print("  [--check]:      (optional) Check all audio files with ffprobe before")
+        print("                  writing and stop if a file is unreadable or has no audio.")
+        print("")
+        print("  [--probe-cache FILE]: (optional) With --check, file in which the ffprobe")
+        print("                  results are remembered (created if it doesn't exist).")
+        print("                  Later checks only probe files that are new or changed.")
+        print("")
+        print("  [--split-silence]: (optional) For recordings of a whole scene in one take:")
+        print("                  every audio file is cut where it is silent for at least")
+        print("                  --min-silence seconds (quieter than --silence-db dBFS),")
+        print("                  and each piece becomes a clip of its own. The pieces are")
+        print("                  cut without re-encoding. Needs NumPy (pip install numpy).")
+        print("")
+        print("  [--dedup]:      (optional) Compare the audio files by content and store")
+        print("                  each recording once in the card folder: every further")
+        print("                  card using it gets a hard link (a copy on drives without")
+        print("                  hard links). The zip file still holds every card's copy.")
+        print("")
+        print("  [--metrics FILE]: (optional) Write the time, CPU time, file and byte counts,")
+        print("                  ffprobe time and peak memory of every stage (scan, cards,")
+        print("                  meta/audio writes, zip) to a JSON file.")
+        print("")
+        print("  [--profile FILE]: (optional) Profile the run (all threads) and write the")
+        print("                  cProfile statistics to FILE (view: python3 -m pstats FILE).")
         sys.exit(1)
 
     source_folder_path = sys.argv[1]
     destination_folder_path = sys.argv[2]
     create_zip = "--no-zip" not in sys.argv
+    zip_only = "--zip-only" in sys.argv
+    deterministic = "--deterministic" in sys.argv
+    jobs = get_option(sys.argv, "--jobs", str(os.cpu_count() or 1))
+    check = "--check" in sys.argv
+    probe_cache = get_option(sys.argv, "--probe-cache")
+    split = "--split-silence" in sys.argv
+    dedup = "--dedup" in sys.argv
+    silence_db = get_option(sys.argv, "--silence-db", str(DEFAULT_SILENCE_DB))
+    min_silence = get_option(sys.argv, "--min-silence", str(DEFAULT_MIN_SILENCE))
+    metrics_path = get_option(sys.argv, "--metrics")
+    profile_path = get_option(sys.argv, "--profile")
+    
+    # Validate zip options
+    if zip_only and not create_zip:
+        print("ERROR: '--zip-only' and '--no-zip' cannot be used together.")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print("  [--no-zip]:     Create only the card folder.")
+        print("  [--zip-only]:   Create only the zip file.")
+        sys.exit(1)
+    
+    # Validate job count
+    if not jobs.isdigit() or int(jobs) < 1:
+        print(f"ERROR: '--jobs {jobs}' is not a valid number of parallel jobs.")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print("  [--jobs N]:     Must be a positive whole number (e.g., '--jobs 4').")
+        sys.exit(1)
+    jobs = int(jobs)
+    
+    # Validate silence detection options
+    try:
+        silence_db, min_silence = float(silence_db), float(min_silence)
+        if silence_db >= 0 or min_silence <= 0:
+            raise ValueError
+    except ValueError:
+        print("ERROR: --silence-db or --min-silence has an invalid value.")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print("  [--silence-db DB]: Must be a level below zero (e.g., '--silence-db -45').")
+        print("  [--min-silence SECONDS]: Must be more than zero seconds (e.g., '--min-silence 1.5').")
+        sys.exit(1)
+    if split:
+        try:
+            require_numpy("--split-silence")
+        except ImportError as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
     
     # Validate input folder
     if not os.path.isdir(source_folder_path):
@@ -185,13 +700,28 @@ if __name__ == "__main__":
     print(f"Input folder: {source_folder_path}")
     print(f"Output folder: {destination_folder_path}")
     print(f"Create zip: {create_zip}")
+    print(f"Zip only (no folder): {zip_only}")
+    print(f"Deterministic IDs: {deterministic}")
+    print(f"Parallel jobs: {jobs}")
+    print(f"Preflight check: {check}")
+    if split:
+        print(f"Split at silences: below {silence_db} dBFS for at least {min_silence} s")
+    print(f"Deduplicate audio: {dedup}")
     print("=" * 70)
     print("")
     
-    main_dir_path = generate_meta_files(source_folder_path, destination_folder_path)
-    if main_dir_path:
-        print('')
-        print(f"Output folder: {main_dir_path}")
-        if create_zip:
-            zip_folder(main_dir_path)
-            print(f"Zipped to: {main_dir_path}.zip")
+    with collect_metrics("generate-cards", metrics_path, profile_path):
+        main_dir_path = generate_meta_files(source_folder_path, destination_folder_path, jobs, zip_only,
+                                            deterministic, check, probe_cache, split, silence_db, min_silence,
+                                            dedup)
+        if main_dir_path:
+            print('')
+            if zip_only:
+                print(f"Zipped to: {main_dir_path}.zip")
+            else:
+                print(f"Output folder: {main_dir_path}")
+                if create_zip:
+                    zip_folder(main_dir_path, jobs)
+                    print(f"Zipped to: {main_dir_path}.zip")
+    if not main_dir_path:
+        sys.exit(1)
@@ -6,16 +6,69 @@ A simple graphical interface for non-technical users
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-import subprocess
 import os
 import sys
+import queue
 import threading
+import time
+from collections import deque
+from job_control import Job, JobOutput
+from tool_loader import load_tool
+
+POLL_INTERVAL_MS = 100  # how often job events are moved into the window
+EVENTS_PER_POLL = 500   # keeps the window responsive when a job prints a lot
+
+
+def flatten_job(source, dest, jobs):
+    flatten = load_tool("flatten-folder.py")
+    if not flatten.copy_and_rename_files(source, dest, jobs):
+        return "Some files would get the same name after flattening, or could not be copied (see the log)."
+
+def convert_job(source, dest, jobs):
+    convert = load_tool("convert-audio.py")
+    convert.mirror_other_files(source, dest)
+    converted, failed = convert.convert_m4a_to_mp3(source, dest, jobs)
+    if failed:
+        return f"{failed} file(s) could not be converted (see the log)."
+
+def concatenate_job(source, output, jobs):
+    concatenate = load_tool("concatenate-audio.py")
+    output_dir = os.path.dirname(output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    if not concatenate.concatenate_audio(source, output, jobs=jobs):
+        return "Nothing was written (see the log)."
+
+def generate_cards_job(input_folder, output_folder, create_zip, jobs):
+    cards = load_tool("generate-cards.py")
+    os.makedirs(output_folder, exist_ok=True)
+    main_dir_path = cards.generate_meta_files(input_folder, output_folder, jobs)
+    if not main_dir_path:
+        return "No cards were generated (see the log)."
+    print(f"Output folder: {main_dir_path}")
+    if create_zip:
+        cards.zip_folder(main_dir_path, jobs)
+        print(f"Zipped to: {main_dir_path}.zip")
+
 
 class TheaterAuftaktGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Theater Auftakt - Audio Processing Tools")
-        self.root.geometry("800x700")
+        self.root.geometry("800x950")
+        self.cpu_count = os.cpu_count() or 1
+        self.jobs = {}           # job list row -> Job, in the order the jobs were added
+        self.logs = {}           # job list row -> output lines of its job
+        self.pending = deque()   # (row, function, arguments) of the queued jobs
+        self.running = set()     # rows of the running jobs
+        
+        # Status bar
+        self.status_var = tk.StringVar(value="Ready")
+        status_bar = ttk.Label(root, textvariable=self.status_var, relief=tk.SUNKEN)
+        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        
+        # Job queue, progress and log of the selected job
+        self.create_job_panel()
         
         # Create notebook for tabs
         self.notebook = ttk.Notebook(root)
@@ -27,10 +80,37 @@ class TheaterAuftaktGUI:
         self.create_concatenate_tab()
         self.create_generate_cards_tab()
         
-        # Status bar
-        self.status_var = tk.StringVar(value="Ready")
-        status_bar = ttk.Label(root, textvariable=self.status_var, relief=tk.SUNKEN)
-        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.root.after(POLL_INTERVAL_MS, self.poll_jobs)
+    
+    def create_job_panel(self):
+        frame = ttk.LabelFrame(self.root, text="Jobs")
+        frame.pack(side=tk.BOTTOM, fill=tk.BOTH, padx=10, pady=(0, 10))
+        
+        controls = ttk.Frame(frame)
+        controls.pack(fill=tk.X, pady=5)
+        ttk.Label(controls, text="Parallel jobs:").pack(side=tk.LEFT, padx=5)
+        self.parallel_jobs = tk.IntVar(value=1)
+        ttk.Spinbox(controls, from_=1, to=self.cpu_count, textvariable=self.parallel_jobs, width=4,
+                    command=self.start_jobs).pack(side=tk.LEFT)
+        ttk.Label(controls, text=f"({self.cpu_count} CPU threads are shared between the running jobs)").pack(
+            side=tk.LEFT, padx=5)
+        ttk.Button(controls, text="Clear Finished", command=self.clear_finished).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(controls, text="Cancel Selected", command=self.cancel_selected).pack(side=tk.RIGHT)
+        
+        self.job_list = ttk.Treeview(frame, columns=("status", "elapsed", "progress", "throughput"), height=5,
+                                     selectmode="browse")
+        self.job_list.heading("#0", text="Job")
+        for column, title in (("status", "Status"), ("elapsed", "Elapsed"), ("progress", "Progress"),
+                              ("throughput", "Throughput")):
+            self.job_list.heading(column, text=title)
+            self.job_list.column(column, width=95, anchor=tk.CENTER, stretch=False)
+        self.job_list.pack(fill=tk.X)
+        self.job_list.bind("<<TreeviewSelect>>", self.show_selected_job)
+        
+        self.progress = ttk.Progressbar(frame, mode="determinate")
+        self.progress.pack(fill=tk.X, pady=5)
+        self.log = scrolledtext.ScrolledText(frame, height=10, state=tk.DISABLED)
+        self.log.pack(fill=tk.BOTH, expand=True)
     
     def create_flatten_tab(self):
         frame = ttk.Frame(self.notebook)
@@ -157,27 +237,144 @@ class TheaterAuftaktGUI:
         if file:
             var.set(file)
     
-    def run_script(self, script_name, args):
-        """Run a script in a separate thread and show output"""
-        def run():
-            try:
-                self.status_var.set(f"Running {script_name}...")
-                script_path = os.path.join(os.path.dirname(__file__), script_name)
-                
-                cmd = [sys.executable, script_path] + args
-                result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-                
-                if result.returncode == 0:
-                    self.status_var.set(f"{script_name} completed successfully!")
-                    messagebox.showinfo("Success", f"{script_name} completed successfully!")
-                else:
-                    self.status_var.set(f"{script_name} failed")
-                    messagebox.showerror("Error", f"{script_name} failed:\n{result.stderr}")
-            except Exception as e:
-                self.status_var.set(f"Error: {str(e)}")
-                messagebox.showerror("Error", f"An error occurred: {str(e)}")
-        
-        threading.Thread(target=run, daemon=True).start()
+    def parallel_limit(self):
+        try:
+            return max(1, min(self.parallel_jobs.get(), self.cpu_count))
+        except tk.TclError:  # the spinbox holds something that is not a number
+            return 1
+    
+    def queue_job(self, name, func, *args):
+        """
+        Add a tool run to the job queue. func is called as func(*args, jobs) on a
+        worker thread of this process once fewer jobs than the parallel limit run.
+        """
+        job = Job(name)
+        row = self.job_list.insert("", tk.END, text=name, values=("queued", "", "", ""))
+        self.jobs[row] = job
+        self.logs[row] = []
+        self.pending.append((row, func, args))
+        if not self.job_list.selection():
+            self.job_list.selection_set(row)
+        self.start_jobs()
+    
+    def start_jobs(self):
+        """
+        Start queued jobs up to the parallel limit. Every tool already runs its files
+        in parallel, so the CPU threads are split between the running jobs instead of
+        giving each job all of them.
+        """
+        limit = self.parallel_limit()
+        while self.pending and len(self.running) < limit:
+            row, func, args = self.pending.popleft()
+            self.running.add(row)
+            workers = max(1, self.cpu_count // limit)
+            threading.Thread(target=self.jobs[row].run, args=(func,) + args + (workers,), daemon=True).start()
+        if self.running:
+            self.status_var.set(f"{len(self.running)} job(s) running, {len(self.pending)} queued")
+    
+    def cancel_selected(self):
+        dequeued = False
+        for row in self.job_list.selection():
+            job = self.jobs[row]
+            job.cancel()
+            if job.status == "queued":
+                self.pending = deque(entry for entry in self.pending if entry[0] != row)
+                job.status = "cancelled"
+                dequeued = True
+            self.update_row(row)
+        if dequeued:
+            self.queue_changed()
+    
+    def clear_finished(self):
+        for row, job in list(self.jobs.items()):
+            if job.status not in ("queued", "running"):
+                self.job_list.delete(row)
+                del self.jobs[row], self.logs[row]
+        self.show_selected_job()
+    
+    def poll_jobs(self):
+        """Move the events of the running jobs into the window (called from the Tk event loop)."""
+        finished = False
+        selected = self.job_list.selection()
+        for row in list(self.running):
+            job = self.jobs[row]
+            lines = []
+            for _ in range(EVENTS_PER_POLL):
+                try:
+                    event = job.events.get_nowait()
+                except queue.Empty:
+                    break
+                if event[0] == "output":
+                    lines.append(event[1])
+                elif event[0] == "finished":
+                    status, message = event[1:]
+                    if status == "failed":
+                        lines.append(f"ERROR: {message}")
+                    self.running.discard(row)
+                    finished = True
+                    break
+            self.logs[row].extend(lines)
+            if row in selected and lines:
+                self.append_log("".join(line + "\n" for line in lines))
+            self.update_row(row)
+        if finished:
+            self.queue_changed()
+        self.root.after(POLL_INTERVAL_MS, self.poll_jobs)
+    
+    def queue_changed(self):
+        """Start queued jobs after one finished or was removed; summarise once none are left."""
+        self.start_jobs()
+        if not self.running:
+            self.report_finished()
+    
+    def update_row(self, row):
+        from audio_probe import format_duration  # loaded with the first job, not at start-up
+        job = self.jobs[row]
+        done, total = job.progress
+        elapsed = job.elapsed()
+        self.job_list.item(row, values=(
+            job.status,
+            format_duration(elapsed) if job.started else "",
+            f"{done}/{total}" if total else "",
+            f"{done / elapsed:.1f} files/s" if done and elapsed else "",
+        ))
+        if row in self.job_list.selection():
+            self.progress.configure(maximum=total or 1, value=done)
+    
+    def show_selected_job(self, event=None):
+        self.log.configure(state=tk.NORMAL)
+        self.log.delete("1.0", tk.END)
+        self.log.configure(state=tk.DISABLED)
+        self.progress.configure(maximum=1, value=0)
+        for row in self.job_list.selection():
+            self.append_log("".join(line + "\n" for line in self.logs[row]))
+            self.update_row(row)
+    
+    def append_log(self, text):
+        if text:
+            self.log.configure(state=tk.NORMAL)
+            self.log.insert(tk.END, text)
+            self.log.see(tk.END)
+            self.log.configure(state=tk.DISABLED)
+    
+    def report_finished(self):
+        """Summarise the job list once the queue has run empty."""
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        summary = ", ".join(f"{count} {status}" for status, count in counts.items())
+        self.status_var.set(f"All jobs finished: {summary}")
+        if counts.get("failed"):
+            messagebox.showerror("Jobs Finished", f"All jobs finished: {summary}\n\n"
+                                 "Select a failed job to see its log.")
+        else:
+            messagebox.showinfo("Jobs Finished", f"All jobs finished: {summary}")
+    
+    def check_folder(self, folder):
+        if not os.path.isdir(folder):
+            messagebox.showwarning("Invalid Input", f"'{folder}' is not an existing folder")
+            return False
+        return True
     
     def run_flatten(self):
         source = self.flatten_source.get()
@@ -185,7 +382,8 @@ class TheaterAuftaktGUI:
         if not source or not dest:
             messagebox.showwarning("Missing Input", "Please select both source and destination folders")
             return
-        self.run_script("flatten-folder.py", [source, dest])
+        if self.check_folder(source):
+            self.queue_job(f"Flatten Folder: {os.path.basename(os.path.normpath(source))}", flatten_job, source, dest)
     
     def run_convert(self):
         source = self.convert_source.get()
@@ -193,7 +391,8 @@ class TheaterAuftaktGUI:
         if not source or not dest:
             messagebox.showwarning("Missing Input", "Please select both source and destination folders")
             return
-        self.run_script("convert-audio.py", [source, dest])
+        if self.check_folder(source):
+            self.queue_job(f"Convert Audio: {os.path.basename(os.path.normpath(source))}", convert_job, source, dest)
     
     def run_concatenate(self):
         source = self.concat_source.get()
@@ -201,7 +400,9 @@ class TheaterAuftaktGUI:
         if not source or not output:
             messagebox.showwarning("Missing Input", "Please select source folder and output file")
             return
-        self.run_script("concatenate-audio.py", [source, output])
+        if self.check_folder(source):
+            self.queue_job(f"Concatenate Audio: {os.path.basename(os.path.normpath(source))}", concatenate_job,
+                           source, output)
     
     def run_generate_cards(self):
         input_folder = self.cards_input.get()
@@ -209,12 +410,21 @@ class TheaterAuftaktGUI:
         if not input_folder or not output_folder:
             messagebox.showwarning("Missing Input", "Please select both input and output folders")
             return
-        args = [input_folder, output_folder]
-        if not self.create_zip.get():
-            args.append("--no-zip")
-        self.run_script("generate-cards.py", args)
+        if self.check_folder(input_folder):
+            self.queue_job(f"Generate Cards: {os.path.basename(os.path.normpath(input_folder))}", generate_cards_job,
+                           input_folder, output_folder, self.create_zip.get())
 
 if __name__ == "__main__":
+    # Tool output goes to the job it was printed for; anything else to the console (if any)
+    sys.stdout = JobOutput(sys.stdout)
     root = tk.Tk()
     app = TheaterAuftaktGUI(root)
-    root.mainloop()
+    if "--startup-probe" in sys.argv[1:-1]:
+        # Used by 'run-benchmark.py --startup': record when the window is first shown, then quit
+        root.wait_visibility()
+        root.update()
+        with open(sys.argv[sys.argv.index("--startup-probe") + 1], "w") as probe_file:
+            probe_file.write(repr(time.time()))
+        root.destroy()
+    else:
+        root.mainloop()
@@ -0,0 +1,180 @@
+"""
+Job control for running the tools in-process, e.g. from the GUI launcher.
+A Job turns the output of one tool run into events (output lines and "[done/total]"
+progress), can be cancelled, and kills the ffmpeg processes it started. The current
+job travels with the code in a context variable; submit() hands it on to worker
+threads and JobOutput routes print() output to it.
+"""
+
+import contextvars
+import queue
+import re
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+PROGRESS_PATTERN = re.compile(r'^\[(\d+)/(\d+)\]')
+
+current_job = contextvars.ContextVar("current_job", default=None)
+
+
+class JobCancelled(Exception):
+    """Raised inside a tool when its job has been cancelled."""
+
+
+class Job:
+    """
+    One in-process tool run. Its events queue receives ('output', line),
+    ('progress', done, total) and finally ('finished', status, message) with
+    status 'done', 'failed' or 'cancelled'. status, started/ended (time.monotonic())
+    and progress (done, total) describe the job as seen so far.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.events = queue.Queue()
+        self.cancelled = threading.Event()
+        self.processes = set()
+        self.lock = threading.Lock()
+        self.status = "queued"
+        self.started = self.ended = None
+        self.progress = (0, 0)
+        self._partial = ""
+
+    def elapsed(self):
+        """Seconds the job has been running (or ran), 0 while it is queued."""
+        if self.started is None:
+            return 0.0
+        return (self.ended or time.monotonic()) - self.started
+
+    def write(self, text):
+        with self.lock:
+            lines = (self._partial + text).split("\n")
+            self._partial = lines.pop()
+        for line in lines:
+            self.events.put(("output", line))
+            match = PROGRESS_PATTERN.match(line)
+            if match:
+                self.progress = (int(match.group(1)), int(match.group(2)))
+                self.events.put(("progress",) + self.progress)
+
+    def cancel(self):
+        """Stop the job: running subprocesses are killed and the tool stops at its next check."""
+        self.cancelled.set()
+        with self.lock:
+            processes = list(self.processes)
+        for process in processes:
+            _kill(process)
+
+    def register(self, process):
+        with self.lock:
+            self.processes.add(process)
+        if self.cancelled.is_set():
+            _kill(process)
+
+    def unregister(self, process):
+        with self.lock:
+            self.processes.discard(process)
+
+    def run(self, func, *args):
+        """
+        Run func(*args) as this job in the calling thread. func returns None on
+        success or an error message; exceptions are reported as failures. A job
+        cancelled before it starts finishes as cancelled without calling func.
+        """
+        context = contextvars.copy_context()
+        context.run(self._run, func, args)
+
+    def _run(self, func, args):
+        current_job.set(self)
+        self.status, self.started = "running", time.monotonic()
+        try:
+            check_cancelled()
+            message = func(*args)
+            status = "failed" if message else "done"
+        except JobCancelled:
+            status, message = "cancelled", None
+        except Exception as e:
+            # Killing a subprocess can also surface as e.g. a broken pipe
+            status = "cancelled" if self.cancelled.is_set() else "failed"
+            message = str(e) or type(e).__name__
+        if self._partial:
+            self.write("\n")
+        self.status, self.ended = status, time.monotonic()
+        self.events.put(("finished", status, message))
+
+
+def _kill(process):
+    try:
+        process.kill()
+    except OSError:
+        pass
+
+
+def check_cancelled():
+    """Raise JobCancelled if the job this code runs for has been cancelled."""
+    job = current_job.get()
+    if job is not None and job.cancelled.is_set():
+        raise JobCancelled()
+
+
+def _call(fn, args, kwargs):
+    check_cancelled()
+    return fn(*args, **kwargs)
+
+
+def submit(executor, fn, *args, **kwargs):
+    """
+    executor.submit() for the tools: the task runs in the current job's context
+    and is skipped (raising JobCancelled) once the job has been cancelled.
+    """
+    return executor.submit(contextvars.copy_context().run, _call, fn, args, kwargs)
+
+
+@contextmanager
+def tracked_process(process):
+    """Let the current job kill a Popen process when it is cancelled."""
+    job = current_job.get()
+    if job is not None:
+        job.register(process)
+    try:
+        yield process
+    finally:
+        if job is not None:
+            job.unregister(process)
+
+
+def run_process(args, check=False, capture_output=False, **kwargs):
+    """
+    subprocess.run() for the tools: the process is killed if the current job is
+    cancelled, in which case JobCancelled is raised instead of returning.
+    """
+    if capture_output:
+        kwargs["stdout"] = kwargs["stderr"] = subprocess.PIPE
+    check_cancelled()
+    with subprocess.Popen(args, **kwargs) as process, tracked_process(process):
+        stdout, stderr = process.communicate()
+    check_cancelled()
+    if check and process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args, stdout, stderr)
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+
+class JobOutput:
+    """Replacement for sys.stdout that sends output written for a job to that job."""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def write(self, text):
+        job = current_job.get()
+        if job is not None:
+            job.write(text)
+        elif self.fallback is not None:
+            self.fallback.write(text)
+        return len(text)
+
+    def flush(self):
+        if self.fallback is not None:
+            self.fallback.flush()
@@ -0,0 +1,186 @@
+"""
+Decoded-audio cache for the tools: every source file is decoded once with ffmpeg
+into raw 16-bit PCM on disk, keyed by a hash of its content and the decode
+parameters, and later read back through memory maps instead of being decoded
+again. The least recently used entries are deleted once the cache grows beyond
+its size limit. Entries handed out by pcm_path() are never deleted before they
+are released.
+"""
+
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from folder_scan import file_hash
+from run_metrics import metrics
+from job_control import run_process
+
+DEFAULT_MAX_MB = 4096
+SAMPLE_WIDTH = 2  # bytes per sample of the cached PCM (s16le)
+
+
+@contextmanager
+def map_pcm(pcm_path):
+    """
+    Yield the content of a PCM file as a read-only memoryview of a memory map.
+    Nothing is read into memory up front; pages are loaded as they are accessed.
+    """
+    with open(pcm_path, "rb") as pcm_file:
+        if os.fstat(pcm_file.fileno()).st_size == 0:
+            yield memoryview(b"")  # empty files cannot be mapped
+            return
+        with mmap.mmap(pcm_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                yield view
+            finally:
+                view.release()
+
+
+class PcmCache:
+    """
+    Folder of decoded PCM files, one per source file and decode parameters, with an
+    SQLite index of content hashes (keyed by path, size and modification time, so an
+    unchanged file is not hashed again) and of when each entry was last used.
+    Entries handed out by pcm_path() stay pinned, and are left out of eviction,
+    until they are released. Safe to use from several threads.
+    """
+
+    def __init__(self, cache_dir, max_mb=DEFAULT_MAX_MB):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=30,
+                                          check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries (name TEXT PRIMARY KEY, size INTEGER, last_used REAL)"
+        )
+        self.pinned = {}  # entry name -> number of pcm_path() results not released yet
+        self.hits = 0
+        self.misses = 0
+
+    def _digest(self, source_path):
+        stat = os.stat(source_path)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT size, mtime_ns, digest FROM sources WHERE path = ?", (os.path.abspath(source_path),)
+            ).fetchone()
+        if row is not None and (row[0], row[1]) == (stat.st_size, stat.st_mtime_ns):
+            return row[2]
+        digest = file_hash(source_path)
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sources (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)",
+                (os.path.abspath(source_path), stat.st_size, stat.st_mtime_ns, digest),
+            )
+        return digest
+
+    def pcm_path(self, source_path, sample_rate, channels):
+        """
+        Return the path of the decoded 16-bit PCM of a file at the given sample rate
+        and channel count, decoding it first if it is not cached yet. The entry is not
+        evicted until release() is called with the path.
+        Raises RuntimeError if ffmpeg cannot decode the file.
+        """
+        name = f"{self._digest(source_path)}-{sample_rate}-{channels}.s16le"
+        path = os.path.join(self.cache_dir, name)
+        with self.lock:
+            known = self.connection.execute("SELECT 1 FROM entries WHERE name = ?", (name,)).fetchone()
+            if known and os.path.exists(path):
+                self.hits += 1
+                self.pinned[name] = self.pinned.get(name, 0) + 1
+                self.connection.execute("UPDATE entries SET last_used = ? WHERE name = ?", (time.time(), name))
+                return path
+
+        # Decode straight to disk, so a long recording is never held in memory
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with metrics.subprocess("decode"):
+                result = run_process(
+                    ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-i', source_path,
+                     '-f', 's16le', '-ar', str(sample_rate), '-ac', str(channels), temp_path],
+                    capture_output=True
+                )
+            if result.returncode != 0:
+                raise RuntimeError(
+                    f"ffmpeg could not decode {source_path}: {result.stderr.decode(errors='replace').strip()}"
+                )
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        with self.lock:
+            self.misses += 1
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries (name, size, last_used) VALUES (?, ?, ?)",
+                (name, os.path.getsize(path), time.time()),
+            )
+            self.pinned[name] = self.pinned.get(name, 0) + 1
+            self._evict()
+            self.connection.commit()
+        return path
+
+    def release(self, pcm_path):
+        """Unpin an entry returned by pcm_path(); once no result of it is held any more, it may be evicted."""
+        name = os.path.basename(pcm_path)
+        with self.lock:
+            self.pinned[name] -= 1
+            if self.pinned[name]:
+                return
+            del self.pinned[name]
+            self._evict()
+            self.connection.commit()
+
+    @contextmanager
+    def open_pcm(self, source_path, sample_rate, channels):
+        """Yield the decoded PCM of a file (see pcm_path) as a memory-mapped, read-only memoryview."""
+        path = self.pcm_path(source_path, sample_rate, channels)
+        try:
+            with map_pcm(path) as pcm:
+                yield pcm
+        finally:
+            self.release(path)
+
+    def _evict(self):
+        """
+        Delete least recently used entries until the cache fits its size limit (called
+        with the lock held). Pinned entries are skipped, so the cache may stay above its
+        limit until they are released.
+        """
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.connection.execute("SELECT name, size FROM entries ORDER BY last_used").fetchall()
+        for name, size in rows:
+            if name in self.pinned:
+                continue
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue  # still mapped by another process (Windows); try again next time
+            self.connection.execute("DELETE FROM entries WHERE name = ?", (name,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+        if self.hits or self.misses:
+            print(f"PCM cache: {self.hits} file(s) reused, {self.misses} decoded")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,378 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import statistics
+
+from tool_loader import TOOL_DIR, load_tool
+from run_metrics import peak_rss_mb
+
+STAGES = ("flatten", "convert", "concatenate", "cards", "zip")
+TOOL_SCRIPTS = ("flatten-folder.py", "convert-audio.py", "concatenate-audio.py", "generate-cards.py", "run-pipeline.py")
+
+
+def generate_corpus(corpus_folder, scenes=5, clips=20, duration=(2.0, 10.0), seed=1):
+    """
+    Create a reproducible synthetic production: 'Scene N' folders with 'audio (N).m4a'
+    clips, each a sine tone from ffmpeg's lavfi source with a seeded frequency and
+    duration. An existing corpus with the same parameters is reused.
+    """
+    params = {"scenes": scenes, "clips": clips, "duration": list(duration), "seed": seed}
+    info_path = corpus_folder + ".json"
+    try:
+        with open(info_path, "r") as info_file:
+            if json.load(info_file) == params:
+                print(f"Reusing corpus in {corpus_folder}")
+                return
+    except (OSError, ValueError):
+        pass
+
+    if os.path.exists(corpus_folder):
+        shutil.rmtree(corpus_folder)
+    rng = random.Random(seed)
+    total = scenes * clips
+    for scene in range(1, scenes + 1):
+        scene_folder = os.path.join(corpus_folder, f"Scene {scene}")
+        os.makedirs(scene_folder)
+        for clip in range(1, clips + 1):
+            frequency = rng.randint(200, 2000)
+            seconds = round(rng.uniform(*duration), 2)
+            clip_path = os.path.join(scene_folder, f"audio ({clip}).m4a")
+            subprocess.run(
+                ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-f', 'lavfi',
+                 '-i', f"sine=frequency={frequency}:sample_rate=44100:duration={seconds}",
+                 '-ac', '2', '-c:a', 'aac', '-b:a', '128k', clip_path],
+                check=True, capture_output=True
+            )
+            done = (scene - 1) * clips + clip
+            if done % 50 == 0 or done == total:
+                print(f"[{done}/{total}] clips generated")
+    with open(info_path, "w") as info_file:
+        json.dump(params, info_file, indent=2)
+
+
+def folder_size(folder):
+    """Return (number of files, total bytes) of everything below a folder."""
+    files = size = 0
+    for root, _, names in os.walk(folder):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+
+def prepare_zip(corpus_folder, output_folder, jobs):
+    """
+    Generate the card folder for the zip stage and return its path. Runs in a process
+    of its own, so that card generation does not count towards the zip stage's peak memory.
+    """
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            return load_tool("generate-cards.py").generate_meta_files(corpus_folder, output_folder, jobs)
+        finally:
+            sys.stdout = sys.__stdout__
+
+
+def run_stage(stage, corpus_folder, output_folder, jobs, prepared=None):
+    """
+    Run one entry point on the corpus in this (fresh) process and return its
+    measurements. Tool output is discarded; only the timed call is measured.
+    For the zip stage, prepared is the card folder made by prepare_zip.
+    """
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            files, size = folder_size(corpus_folder)
+            if stage == "flatten":
+                flatten = load_tool("flatten-folder.py")
+                started = time.perf_counter()
+                flatten.copy_and_rename_files(corpus_folder, os.path.join(output_folder, "flat"), jobs)
+            elif stage == "convert":
+                convert = load_tool("convert-audio.py")
+                started = time.perf_counter()
+                convert.convert_m4a_to_mp3(corpus_folder, os.path.join(output_folder, "converted"), jobs)
+            elif stage == "concatenate":
+                concatenate = load_tool("concatenate-audio.py")
+                started = time.perf_counter()
+                concatenate.concatenate_audio(corpus_folder, os.path.join(output_folder, "all.m4a"), jobs=jobs)
+            elif stage == "cards":
+                cards = load_tool("generate-cards.py")
+                started = time.perf_counter()
+                cards.generate_meta_files(corpus_folder, output_folder, jobs)
+            else:
+                cards = load_tool("generate-cards.py")
+                files, size = folder_size(prepared)
+                started = time.perf_counter()
+                cards.zip_folder(prepared, jobs)
+            seconds = time.perf_counter() - started
+        finally:
+            sys.stdout = sys.__stdout__
+
+    return {
+        "seconds": round(seconds, 3),
+        "files": files,
+        "bytes": size,
+        "files_per_sec": round(files / seconds, 1) if seconds else None,
+        "mb_per_sec": round(size / (1024 * 1024) / seconds, 2) if seconds else None,
+        "peak_rss_mb": peak_rss_mb("self"),
+        "peak_child_rss_mb": peak_rss_mb("children"),
+    }
+
+
+def run_benchmark(work_folder, stages=STAGES, jobs=1, scenes=5, clips=20, duration=(2.0, 10.0), seed=1):
+    """
+    Generate (or reuse) the corpus in work_folder and time every stage in its own
+    process, so that peak memory is measured per stage. Returns the results dict.
+    """
+    corpus_folder = os.path.join(work_folder, "corpus")
+    generate_corpus(corpus_folder, scenes, clips, duration, seed)
+
+    results = {
+        "corpus": {"scenes": scenes, "clips": clips, "duration": list(duration), "seed": seed},
+        "jobs": jobs,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "stages": {},
+    }
+    context = multiprocessing.get_context("spawn")
+    for stage in stages:
+        output_folder = os.path.join(work_folder, "output", stage)
+        if os.path.exists(output_folder):
+            shutil.rmtree(output_folder)
+        os.makedirs(output_folder)
+        prepared = None
+        if stage == "zip":
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                prepared = executor.submit(prepare_zip, corpus_folder, output_folder, jobs).result()
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            measured = executor.submit(run_stage, stage, corpus_folder, output_folder, jobs, prepared).result()
+        results["stages"][stage] = measured
+        print(f"{stage:<12} {measured['seconds']:>9.2f} s  {measured['files_per_sec'] or 0:>9.1f} files/s  "
+              f"{measured['mb_per_sec'] or 0:>8.2f} MB/s  peak RSS {measured['peak_rss_mb']} MB")
+    return results
+
+
+def time_usage_output(command):
+    """Start a tool without parameters and return the seconds until it prints its USAGE line."""
+    started = time.perf_counter()
+    seconds = None
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True) as process:
+        for line in process.stdout:
+            if seconds is None and line.startswith("USAGE:"):
+                seconds = time.perf_counter() - started
+    return seconds
+
+
+def time_first_window(command, probe_path, timeout=60):
+    """
+    Start the GUI with --startup-probe and return the seconds until its window was
+    shown, or None if it was not (e.g. no display).
+    """
+    if os.path.exists(probe_path):
+        os.remove(probe_path)
+    started = time.time()
+    try:
+        subprocess.run(command + ["--startup-probe", probe_path], capture_output=True, timeout=timeout)
+        with open(probe_path, "r") as probe_file:
+            return float(probe_file.read()) - started
+    except (subprocess.TimeoutExpired, OSError, ValueError):
+        return None
+
+
+def measure_startup(work_folder, runs=5, launcher=None):
+    """
+    Time the start of the GUI (until its window is shown) and of every command-line
+    tool (until its usage output), `runs` times each. The first run is reported
+    separately because it is the closest to a cold start. launcher is a built GUI
+    executable (e.g. dist/Theater-Auftakt.exe) to time instead of gui-launcher.py.
+    """
+    os.makedirs(work_folder, exist_ok=True)
+    probe_path = os.path.join(work_folder, "startup-probe.txt")
+    measurements = {"gui window": lambda: time_first_window(
+        [launcher] if launcher else [sys.executable, os.path.join(TOOL_DIR, "gui-launcher.py")], probe_path)}
+    for script in TOOL_SCRIPTS:
+        command = [sys.executable, os.path.join(TOOL_DIR, script)]
+        measurements[f"{os.path.splitext(script)[0]} usage"] = lambda command=command: time_usage_output(command)
+
+    results = {
+        "corpus": "startup",
+        "jobs": None,
+        "runs": runs,
+        "launcher": launcher,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "stages": {},
+    }
+    for name, measure in measurements.items():
+        times = [measure() for _ in range(runs)]
+        if None in times:
+            print(f"{name:<28} not measured (the window was not shown; is a display available?)")
+            continue
+        measured = {"seconds": round(statistics.median(times), 3), "first_seconds": round(times[0], 3),
+                    "min_seconds": round(min(times), 3), "max_seconds": round(max(times), 3)}
+        results["stages"][name] = measured
+        print(f"{name:<28} {measured['seconds']:>7.3f} s median  {measured['first_seconds']:>7.3f} s first  "
+              f"{measured['min_seconds']:>7.3f}-{measured['max_seconds']:.3f} s")
+    return results
+
+
+def compare_results(baseline, results):
+    """Print the change of every stage against a baseline (positive = slower)."""
+    if baseline.get("corpus") != results["corpus"] or baseline.get("jobs") != results["jobs"]:
+        print("Warning: the baseline was measured with a different corpus, job count or mode (--startup)")
+    width = max([12] + [len(stage) for stage in results["stages"]])
+    print(f"{'stage':<{width}} {'baseline':>10} {'now':>10} {'change':>8}")
+    for stage, measured in results["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before:
+            print(f"{stage:<{width}} {'-':>10} {measured['seconds']:>9.2f}s {'new':>8}")
+            continue
+        change = (measured["seconds"] - before["seconds"]) / before["seconds"] * 100 if before["seconds"] else 0
+        print(f"{stage:<{width}} {before['seconds']:>9.2f}s {measured['seconds']:>9.2f}s {change:>+7.1f}%")
+
+
+def get_option(argv, name, default=None):
+    """Return the value following an option like '--jobs 4', or default if it is absent."""
+    if name in argv:
+        index = argv.index(name)
+        if index + 1 < len(argv):
+            return argv[index + 1]
+    return default
+
+
+if __name__ == "__main__":
+    print("=" * 70)
+    print("RUN BENCHMARK")
+    print("=" * 70)
+    print("WHAT THIS DOES:")
+    print("  Generates a reproducible synthetic production (sine tones, created")
+    print("  offline with ffmpeg) and times flatten, convert, concatenate, card")
+    print("  generation and zipping on it. Each stage runs in its own process;")
+    print("  time, files/s, MB/s and peak memory are printed and can be saved")
+    print("  as a JSON baseline and compared between runs.")
+    print("")
+    print("PARAMETERS:")
+    print("  <work-folder>    (required) Folder for the corpus and the outputs")
+    print("  [--scenes N]     (optional) Number of scene folders (default: 5)")
+    print("  [--clips N]      (optional) Clips per scene (default: 20)")
+    print("  [--duration MIN-MAX] (optional) Clip length in seconds (default: 2-10)")
+    print("  [--seed N]       (optional) Seed of the corpus (default: 1)")
+    print("  [--jobs N]       (optional) Parallel jobs passed to every stage (default: 1)")
+    print("  [--stages LIST]  (optional) Comma-separated stages (default: all)")
+    print("  [--save FILE]    (optional) Save the results as JSON")
+    print("  [--compare FILE] (optional) Compare with a saved baseline")
+    print("  [--startup]      (optional) Time the start of the GUI and the tools instead")
+    print("  [--runs N]       (optional) Starts per program with --startup (default: 5)")
+    print("  [--launcher EXE] (optional) Built GUI executable to time with --startup")
+    print("")
+
+    if len(sys.argv) < 2 or sys.argv[1].startswith("--"):
+        print("ERROR: Missing required parameters")
+        print("")
+        print("USAGE:")
+        print("  python3 run-benchmark.py <work-folder> [--scenes N] [--clips N] [--duration MIN-MAX]")
+        print("                           [--seed N] [--jobs N] [--stages LIST] [--save FILE] [--compare FILE]")
+        print("  python3 run-benchmark.py <work-folder> --startup [--runs N] [--launcher EXE] [--save FILE] [--compare FILE]")
+        print("")
+        print("EXAMPLE:")
+        print("  python3 run-benchmark.py /tmp/bench --save baseline.json")
+        print("  python3 run-benchmark.py /tmp/bench --jobs 8 --compare baseline.json")
+        print("  python3 run-benchmark.py /tmp/bench --startup --launcher dist/Theater-Auftakt/Theater-Auftakt.exe")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print("  <work-folder>:   Folder in which the corpus ('corpus') and the stage outputs")
+        print("                   ('output') are created. The corpus is reused as long as")
+        print("                   its parameters (recorded in 'corpus.json') do not change.")
+        print("")
+        print(f"  [--stages LIST]: (optional) Any of {', '.join(STAGES)}, e.g.")
+        print("                   '--stages flatten,cards'.")
+        print("")
+        print("  [--startup]:     (optional) Measures how long the GUI takes until its window")
+        print("                   is shown and every tool until it prints its usage output.")
+        print("                   No corpus is generated.")
+        sys.exit(1)
+
+    work_folder = sys.argv[1]
+    numbers = {}
+    for name, default in (("--scenes", "5"), ("--clips", "20"), ("--seed", "1"), ("--jobs", "1"), ("--runs", "5")):
+        value = get_option(sys.argv, name, default)
+        if not value.isdigit() or int(value) < (0 if name == "--seed" else 1):
+            print(f"ERROR: '{name} {value}' is not a valid number.")
+            print("")
+            print("PARAMETER EXPLANATION:")
+            print(f"  [{name} N]:      Must be a positive whole number (e.g., '{name} 4').")
+            sys.exit(1)
+        numbers[name] = int(value)
+    duration = get_option(sys.argv, "--duration", "2-10")
+    stages = get_option(sys.argv, "--stages", ",".join(STAGES)).split(",")
+    save_path = get_option(sys.argv, "--save")
+    compare_path = get_option(sys.argv, "--compare")
+    startup = "--startup" in sys.argv
+    launcher = get_option(sys.argv, "--launcher")
+
+    try:
+        low, high = (float(value) for value in duration.split("-"))
+        if not 0 < low <= high:
+            raise ValueError
+    except ValueError:
+        print(f"ERROR: '--duration {duration}' is not a valid range.")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print("  [--duration MIN-MAX]: Shortest and longest clip in seconds (e.g., '--duration 2-10').")
+        sys.exit(1)
+
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        print(f"ERROR: unknown stage(s): {', '.join(unknown)}")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print(f"  [--stages LIST]: Comma-separated list of {', '.join(STAGES)}.")
+        sys.exit(1)
+
+    baseline = None
+    if compare_path:
+        try:
+            with open(compare_path, "r") as baseline_file:
+                baseline = json.load(baseline_file)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: cannot read baseline '{compare_path}': {e}")
+            sys.exit(1)
+
+    if launcher and not os.path.isfile(launcher):
+        print(f"ERROR: launcher '{launcher}' does not exist.")
+        sys.exit(1)
+
+    print(f"Work folder: {work_folder}")
+    if startup:
+        print(f"Start-up times: {numbers['--runs']} run(s) per program")
+        print(f"GUI: {launcher or 'gui-launcher.py'}")
+    else:
+        print(f"Corpus: {numbers['--scenes']} scene(s) x {numbers['--clips']} clip(s), {low}-{high} s, seed {numbers['--seed']}")
+        print(f"Stages: {', '.join(stages)}")
+        print(f"Parallel jobs: {numbers['--jobs']}")
+    print("=" * 70)
+    print("")
+
+    if startup:
+        results = measure_startup(work_folder, numbers["--runs"], launcher)
+    else:
+        results = run_benchmark(work_folder, stages, numbers["--jobs"], numbers["--scenes"], numbers["--clips"],
+                                (low, high), numbers["--seed"])
+
+    if save_path:
+        with open(save_path + ".tmp", "w") as results_file:
+            json.dump(results, results_file, indent=2, sort_keys=True)
+        os.replace(save_path + ".tmp", save_path)
+        print(f"Results saved to {save_path}")
+    if baseline:
+        print("")
+        compare_results(baseline, results)
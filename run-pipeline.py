@@ -0,0 +1,266 @@
+import os
+import sys
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from folder_scan import AUDIO_EXTENSION, ScanIndex, file_key
+from tool_loader import load_tool
+from job_control import submit
+
+
+def plan_files(source_folder, index_path=None):
+    """
+    Build the shared file plan: (flattened name, source path) for every file, in the
+    order flatten-folder.py would produce. Returns None if two files would get the same name.
+    With index_path, folder listings are cached there to speed up later runs.
+    """
+    flatten = load_tool("flatten-folder.py")
+    if index_path:
+        with ScanIndex(index_path) as index:
+            copies = flatten.plan_copies(source_folder, "", index)
+    else:
+        copies = flatten.plan_copies(source_folder, "")
+    collisions = flatten.find_collisions(copies)
+    if collisions:
+        print(f"ERROR: {len(collisions)} flattened name(s) would be used by more than one file:")
+        for name, sources in sorted(collisions.items()):
+            print(f"  {name}")
+            for source in sources:
+                print(f"    <- {source}")
+        return None
+    return [(name, source_path) for source_path, name in copies]
+
+
+def run_flatten_stage(plan, flatten_dir, jobs, ready_queues, complete):
+    """
+    Hand every planned file to the following stages. If flatten_dir is given, the
+    flattened tree is written (in sync mode) and each file is handed on as soon as
+    its copy exists; otherwise all files are handed on immediately.
+    Files that cannot be flattened are reported and not handed on; the others still
+    are. complete (a threading.Event) is set before the end of the file stream only
+    if every file was handed on.
+    """
+    try:
+        if not flatten_dir:
+            for item in plan:
+                for ready in ready_queues:
+                    ready.put(item)
+            complete.set()
+            return
+        flatten = load_tool("flatten-folder.py")
+        os.makedirs(flatten_dir, exist_ok=True)
+        failed = 0
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                submit(executor, flatten.flatten_file, source_path, os.path.join(flatten_dir, name), None, True): (name, source_path)
+                for name, source_path in plan
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except OSError as e:
+                    failed += 1
+                    print(f"[flatten] Error: {futures[future][1]}: {e}")
+                    continue
+                for ready in ready_queues:
+                    ready.put(futures[future])
+        print(f"[flatten] {len(plan) - failed} file(s) in {flatten_dir}")
+        if failed:
+            raise RuntimeError(f"{failed} file(s) could not be flattened")
+        complete.set()
+    finally:
+        for ready in ready_queues:
+            ready.put(None)  # End of the file stream
+
+
+def ready_files(ready):
+    """Yield (flattened name, source path) items from a stage queue until the stream ends."""
+    while True:
+        item = ready.get()
+        if item is None:
+            return
+        yield item
+
+
+def run_convert_stage(ready, convert_dir, jobs, complete):
+    """
+    Convert each .m4a file to MP3 as soon as the flatten stage hands it over.
+    MP3s of files that were not handed over are only removed if the flatten stage
+    handed over the complete plan (complete is set). Fails if any conversion failed.
+    """
+    convert = load_tool("convert-audio.py")
+    audio = ((name, source_path) for name, source_path in ready_files(ready) if name.endswith(AUDIO_EXTENSION))
+    _, failed = convert.convert_files(audio, convert_dir, jobs, remove_stale=complete.is_set)
+    if failed:
+        raise RuntimeError(f"{failed} file(s) could not be converted")
+
+
+def run_cards_stage(plan, source_name, cards_dir, jobs, create_zip):
+    """Generate cards for all flattened .m4a files, ordered as generate-cards.py orders a flattened folder."""
+    cards = load_tool("generate-cards.py")
+    names = sorted((name for name, _ in plan if name.endswith(AUDIO_EXTENSION)), key=file_key)
+    source_paths = dict(plan)
+    os.makedirs(cards_dir, exist_ok=True)
+    folders = [("_top_level", None, [source_paths[name] for name in names])]
+    main_dir_path = cards.write_card_folders(source_name, folders, cards_dir, jobs)
+    print(f"[cards] Output folder: {main_dir_path}")
+    if create_zip:
+        cards.zip_folder(main_dir_path, jobs)
+        print(f"[cards] Zipped to: {main_dir_path}.zip")
+
+
+def run_concatenate_stage(plan, concat_file, jobs):
+    """Concatenate all .m4a files in flattened order into one file. Fails if no file was written."""
+    concatenate = load_tool("concatenate-audio.py")
+    output_dir = os.path.dirname(concat_file)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    audio_paths = [source_path for name, source_path in plan if name.endswith(AUDIO_EXTENSION)]
+    if not concatenate.concatenate_files(audio_paths, concat_file, jobs=jobs):
+        raise RuntimeError(f"{concat_file} could not be written")
+
+
+def run_pipeline(source_folder, flatten_dir=None, convert_dir=None, cards_dir=None, concat_file=None,
+                 jobs=1, create_zip=True, index_path=None):
+    """
+    Run the requested stages in one process over a shared in-memory file plan.
+    Nothing is copied to an intermediate folder unless flatten_dir is given; every
+    stage reads the source files directly and all stages run at the same time, so
+    the total time approaches that of the slowest stage.
+    Returns True if all stages succeeded.
+    """
+    started = time.monotonic()
+    plan = plan_files(source_folder, index_path)
+    if plan is None:
+        return False
+    print(f"Planned {len(plan)} file(s)")
+    source_name = os.path.basename(os.path.normpath(source_folder))
+
+    convert_queue = queue.Queue()
+    ready_queues = [convert_queue] if convert_dir else []
+    complete = threading.Event()
+    stages = [("flatten", run_flatten_stage, (plan, flatten_dir, jobs, ready_queues, complete))]
+    if convert_dir:
+        stages.append(("convert", run_convert_stage, (convert_queue, convert_dir, jobs, complete)))
+    if cards_dir:
+        stages.append(("cards", run_cards_stage, (plan, source_name, cards_dir, jobs, create_zip)))
+    if concat_file:
+        stages.append(("concatenate", run_concatenate_stage, (plan, concat_file, jobs)))
+
+    errors = []
+
+    def run_stage(name, stage, args):
+        stage_started = time.monotonic()
+        try:
+            stage(*args)
+            print(f"[{name}] finished in {time.monotonic() - stage_started:.1f} s")
+        except Exception as e:
+            errors.append(name)
+            print(f"[{name}] FAILED: {e}")
+
+    threads = [threading.Thread(target=run_stage, args=stage, name=stage[0]) for stage in stages]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print("")
+    print(f"Pipeline finished in {time.monotonic() - started:.1f} s"
+          + (f", failed stages: {', '.join(errors)}" if errors else ""))
+    return not errors
+
+
+def get_option(argv, name, default=None):
+    """Return the value following an option like '--jobs 4', or default if it is absent."""
+    if name in argv:
+        index = argv.index(name)
+        if index + 1 < len(argv):
+            return argv[index + 1]
+    return default
+
+
+if __name__ == "__main__":
+    print("=" * 70)
+    print("RUN PIPELINE")
+    print("=" * 70)
+    print("WHAT THIS DOES:")
+    print("  Runs flatten, convert, generate cards and concatenate in one go.")
+    print("  The source folder is scanned once; every stage reads the original")
+    print("  files directly and all stages run at the same time. Only the outputs")
+    print("  you ask for are written.")
+    print("")
+    print("PARAMETERS:")
+    print("  <source-folder>   (required) Path to folder with the recordings")
+    print("  [--flatten DIR]   (optional) Also write the flattened folder")
+    print("  [--convert DIR]   (optional) Write MP3 versions of all .m4a files")
+    print("  [--cards DIR]     (optional) Generate cards (and a zip file)")
+    print("  [--no-zip]        (optional) With --cards, skip creating the zip file")
+    print("  [--concat FILE]   (optional) Concatenate all audio into one file")
+    print("  [--jobs N]        (optional) Parallel jobs per stage")
+    print("                     (default: number of CPU cores)")
+    print("  [--index FILE]    (optional) Scan index that speeds up repeated scans")
+    print("")
+
+    flatten_dir = get_option(sys.argv, "--flatten")
+    convert_dir = get_option(sys.argv, "--convert")
+    cards_dir = get_option(sys.argv, "--cards")
+    concat_file = get_option(sys.argv, "--concat")
+
+    if len(sys.argv) < 2 or sys.argv[1].startswith("--") or not any((flatten_dir, convert_dir, cards_dir, concat_file)):
+        print("ERROR: Missing required parameters")
+        print("")
+        print("USAGE:")
+        print("  python3 run-pipeline.py <source-folder> [--flatten DIR] [--convert DIR]")
+        print("                          [--cards DIR [--no-zip]] [--concat FILE] [--jobs N]")
+        print("                          [--index FILE]")
+        print("")
+        print("EXAMPLE:")
+        print("  python3 run-pipeline.py data/recordings --convert data/converted \\")
+        print("                          --cards data/cards --concat ./final_review.m4a")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print("  <source-folder>: Must be a path to an existing directory with the")
+        print("                   (nested) recordings.")
+        print("                   Can be relative (e.g., 'data/recordings') or absolute.")
+        print("")
+        print("  At least one of --flatten, --convert, --cards or --concat is required.")
+        print("  Files are named and ordered as if flatten-folder.py had been run first:")
+        print("  --convert writes the MP3s with their flattened names, --cards puts all")
+        print("  files into one '_top_level' folder, --concat joins them in flattened")
+        print("  order.")
+        sys.exit(1)
+
+    source_folder = sys.argv[1]
+    jobs = get_option(sys.argv, "--jobs", str(os.cpu_count() or 1))
+    create_zip = "--no-zip" not in sys.argv
+    index_path = get_option(sys.argv, "--index")
+
+    if not jobs.isdigit() or int(jobs) < 1:
+        print(f"ERROR: '--jobs {jobs}' is not a valid number of parallel jobs.")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print("  [--jobs N]:      Must be a positive whole number (e.g., '--jobs 4').")
+        sys.exit(1)
+    jobs = int(jobs)
+
+    if not os.path.isdir(source_folder):
+        print(f"ERROR: '{source_folder}' is not a valid directory.")
+        print("")
+        print("PARAMETER EXPLANATION:")
+        print("  <source-folder>: Must be a path to an existing directory.")
+        print("                   Can be relative (e.g., 'data/recordings') or absolute.")
+        sys.exit(1)
+
+    print(f"Source folder: {source_folder}")
+    print(f"Flattened folder: {flatten_dir or '(not written)'}")
+    print(f"Converted folder: {convert_dir or '(skipped)'}")
+    print(f"Cards folder: {cards_dir or '(skipped)'}")
+    print(f"Concatenated file: {concat_file or '(skipped)'}")
+    print(f"Parallel jobs: {jobs}")
+    print(f"Scan index: {index_path or '(none)'}")
+    print("=" * 70)
+    print("")
+
+    if not run_pipeline(source_folder, flatten_dir, convert_dir, cards_dir, concat_file, jobs, create_zip, index_path):
+        sys.exit(1)
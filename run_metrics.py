@@ -0,0 +1,174 @@
+"""
+Per-stage timing and resource metrics for the tools. Each tool times its stages
+with metrics.stage(name) on the thread that runs them, times per-file work on
+worker threads with metrics.task(name) and adds file/byte counts and subprocess
+(ffmpeg) times from any thread; collect_metrics() writes them as JSON (--metrics FILE) and can
+record a cProfile dump of all threads (--profile FILE).
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb(who="self"):
+    """
+    Return the peak resident memory of this process ('self') or of its largest
+    finished child process ('children') in MB. None on Windows.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def child_cpu_seconds():
+    """Return the CPU time used by all finished child processes so far. None on Windows."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Metrics:
+    """Collects the measurements of one run, grouped by stage name."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def _entry(self, name):
+        return self.stages.setdefault(name, {"files": 0, "bytes": 0, "subprocesses": 0, "subprocess_seconds": 0.0})
+
+    def _add(self, entry, key, value):
+        entry[key] = entry.get(key, 0.0) + value
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a stage: wall time, CPU time of this process (all threads) and of the
+        child processes that finished during it. Entering a stage again adds to it.
+        The measurements cover the whole process, so stages must not overlap: use
+        stage() on the thread that coordinates the work, and task() on worker threads.
+        """
+        wall, cpu, child = time.perf_counter(), time.process_time(), child_cpu_seconds()
+        try:
+            yield
+        finally:
+            with self.lock:
+                entry = self._entry(name)
+                self._add(entry, "seconds", time.perf_counter() - wall)
+                self._add(entry, "cpu_seconds", time.process_time() - cpu)
+                if child is not None:
+                    self._add(entry, "child_cpu_seconds", child_cpu_seconds() - child)
+                entry["peak_rss_mb"] = peak_rss_mb()
+
+    @contextmanager
+    def task(self, name):
+        """
+        Time one piece of work that may run on a worker thread, e.g. writing one file.
+        Tasks run side by side, so their wall time and the CPU time of their threads
+        are summed under thread_seconds and thread_cpu_seconds, which can exceed the
+        wall time of the run.
+        """
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            with self.lock:
+                entry = self._entry(name)
+                self._add(entry, "thread_seconds", time.perf_counter() - wall)
+                self._add(entry, "thread_cpu_seconds", time.thread_time() - cpu)
+
+    def count(self, name, files=0, size=0):
+        """Add processed files and bytes to a stage."""
+        with self.lock:
+            entry = self._entry(name)
+            entry["files"] += files
+            entry["bytes"] += size
+
+    @contextmanager
+    def subprocess(self, name):
+        """Time one subprocess (e.g. an ffmpeg run) of a stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                entry = self._entry(name)
+                entry["subprocesses"] += 1
+                entry["subprocess_seconds"] += time.perf_counter() - started
+
+    def report(self, tool, seconds):
+        """Return the collected metrics as a JSON-serialisable dict."""
+        with self.lock:
+            stages = {name: {key: round(value, 3) if isinstance(value, float) else value
+                             for key, value in entry.items()}
+                      for name, entry in self.stages.items()}
+        child_cpu = child_cpu_seconds()
+        return {
+            "tool": tool,
+            "argv": sys.argv[1:],
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "seconds": round(seconds, 3),
+            "cpu_seconds": round(time.process_time(), 3),
+            "child_cpu_seconds": child_cpu and round(child_cpu, 3),
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_child_rss_mb": peak_rss_mb("children"),
+            "stages": stages,
+        }
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def collect_metrics(tool, metrics_path=None, profile_path=None):
+    """
+    Run the body of a tool with metrics collection. With metrics_path the metrics
+    are written there as JSON when the body finishes; with profile_path every thread
+    started in the meantime is profiled and the merged cProfile stats are dumped there.
+    """
+    # cProfile and pstats are only imported for --profile; they slow down every tool's start otherwise
+    if profile_path:
+        import cProfile
+        import pstats
+    profiles = []
+
+    def profile_thread(frame, event, arg):
+        # First event in a new thread: hand the thread over to its own profiler
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        profiles.append(profile)
+        profile.enable()
+
+    if profile_path:
+        main_profile = cProfile.Profile()
+        profiles.append(main_profile)
+        threading.setprofile(profile_thread)
+        main_profile.enable()
+    started = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        seconds = time.perf_counter() - started
+        if profile_path:
+            main_profile.disable()
+            threading.setprofile(None)
+            stats = pstats.Stats(*profiles)
+            stats.dump_stats(profile_path)
+            print(f"Profile written to {profile_path} (view with: python3 -m pstats {profile_path})")
+        if metrics_path:
+            temp_path = metrics_path + ".tmp"
+            with open(temp_path, "w") as metrics_file:
+                json.dump(metrics.report(tool, seconds), metrics_file, indent=2, sort_keys=True)
+            os.replace(temp_path, metrics_path)
+            print(f"Metrics written to {metrics_path}")
@@ -0,0 +1,121 @@
+"""
+Splits long takes into separate clips at their silences. Each take is decoded by
+ffmpeg into low-rate mono PCM that is streamed through a pipe and measured with
+NumPy (the RMS level of every short window, a block at a time), so even an
+hour-long recording is analysed in seconds without being held in memory. The
+pieces are then cut from the original file by stream copy, without re-encoding.
+"""
+
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from folder_scan import list_audio_files
+from audio_dsp import FULL_SCALE, require_numpy
+from audio_decode import pcm_chunks
+from run_metrics import metrics
+from job_control import run_process, submit
+
+ANALYSIS_RATE = 8000      # Hz; plenty to tell speech or music from silence
+WINDOW_SECONDS = 0.05     # length of the windows whose level is measured
+MIN_PIECE_SECONDS = 1.0   # cuts that would leave a shorter piece are dropped
+DEFAULT_SILENCE_DB = -40.0
+DEFAULT_MIN_SILENCE = 2.0
+
+
+def window_levels(np, chunks, window_samples):
+    """Return the RMS level in dBFS of every complete window of the 16-bit mono PCM in chunks."""
+    powers = []
+    rest = b""
+    window_bytes = window_samples * 2
+    for chunk in chunks:
+        data = rest + chunk
+        usable = len(data) // window_bytes * window_bytes
+        if usable:
+            block = np.frombuffer(data, dtype="<i2", count=usable // 2).astype(np.float32)
+            block = block.reshape(-1, window_samples)
+            powers.append(np.einsum("ij,ij->i", block, block) / window_samples)
+        rest = data[usable:]
+    if not powers:
+        return np.zeros(0)
+    power = np.concatenate(powers)
+    return 10 * np.log10(np.maximum(power, 1e-3) / FULL_SCALE ** 2)
+
+
+def cut_points(np, levels, silence_db=DEFAULT_SILENCE_DB, min_silence=DEFAULT_MIN_SILENCE):
+    """
+    Return the times (seconds) at which a take is cut: the middle of every silence of at
+    least min_silence seconds that lies between sound, skipping cuts that would leave a
+    piece shorter than MIN_PIECE_SECONDS.
+    """
+    silent = np.concatenate(([0], (levels < silence_db).astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(silent))
+    starts, ends = edges[0::2], edges[1::2]
+    inner = (ends - starts >= min_silence / WINDOW_SECONDS) & (starts > 0) & (ends < len(levels))
+    duration = len(levels) * WINDOW_SECONDS
+    cuts = []
+    for middle in (starts[inner] + ends[inner]) / 2 * WINDOW_SECONDS:
+        if middle - (cuts[-1] if cuts else 0) >= MIN_PIECE_SECONDS and duration - middle >= MIN_PIECE_SECONDS:
+            cuts.append(round(float(middle), 3))
+    return cuts
+
+
+def cut_pieces(source_path, cuts, piece_dir):
+    """Cut a file at the given times into '<name> (part N).m4a' files by stream copy; return their paths."""
+    os.makedirs(piece_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    bounds = [0.0] + cuts + [None]
+    piece_paths = []
+    for number, (start, end) in enumerate(zip(bounds, bounds[1:]), 1):
+        piece_path = os.path.join(piece_dir, f"{stem} (part {number}).m4a")
+        args = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-ss', f"{start:.3f}", '-i', source_path]
+        if end is not None:
+            args += ['-t', f"{end - start:.3f}"]
+        with metrics.subprocess("split"):
+            run_process(args + ['-map', '0:a', '-c', 'copy', piece_path], check=True, capture_output=True)
+        piece_paths.append(piece_path)
+    return piece_paths
+
+
+def split_take(np, source_path, piece_dir, silence_db=DEFAULT_SILENCE_DB, min_silence=DEFAULT_MIN_SILENCE):
+    """
+    Return the paths of the pieces a take is cut into at its silences, or [source_path]
+    if it has none (or cannot be read, which is reported).
+    """
+    try:
+        levels = window_levels(np, pcm_chunks(source_path, ANALYSIS_RATE, 1, "split"), int(ANALYSIS_RATE * WINDOW_SECONDS))
+        cuts = cut_points(np, levels, silence_db, min_silence)
+        if not cuts:
+            return [source_path]
+        piece_paths = cut_pieces(source_path, cuts, piece_dir)
+    except (RuntimeError, subprocess.CalledProcessError) as e:
+        print(f"Warning: {source_path} is not split: {e}")
+        return [source_path]
+    metrics.count("split", 1, os.path.getsize(source_path))
+    print(f"Split {source_path} into {len(piece_paths)} piece(s) at {', '.join(f'{cut:.1f}' for cut in cuts)} s")
+    return piece_paths
+
+
+def split_takes(folders, split_dir, jobs=1, silence_db=DEFAULT_SILENCE_DB, min_silence=DEFAULT_MIN_SILENCE):
+    """
+    Replace every audio file of the (name, folder path, audio paths) entries by the
+    pieces it is cut into at its silences (written below split_dir), in order.
+    Files without silences are kept as they are. Up to `jobs` files are analysed
+    at a time. Returns the new entries.
+    """
+    np = require_numpy("silence detection")
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = []
+        for index, (name, folder_path, audio_paths) in enumerate(folders):
+            if audio_paths is None:
+                audio_paths = [os.path.join(folder_path, f) for f in list_audio_files(folder_path)]
+            # One piece folder per source file, so equal names in different folders do not collide
+            futures = [submit(executor, split_take, np, path, os.path.join(split_dir, f"{index}-{position}"),
+                              silence_db, min_silence)
+                       for position, path in enumerate(audio_paths)]
+            pending.append((name, folder_path, futures))
+        split_folders = [(name, folder_path, [piece for future in futures for piece in future.result()])
+                         for name, folder_path, futures in pending]
+    takes = sum(len(futures) for _, _, futures in pending)
+    pieces = sum(len(paths) for _, _, paths in split_folders)
+    print(f"Silence detection: {takes} file(s) became {pieces} clip(s)")
+    return split_folders
@@ -0,0 +1,59 @@
+import hashlib
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from folder_scan import HASH_CHUNK_SIZE, ScanIndex, file_hash, list_audio_files, list_folder
+
+
+class FileOrderTest(unittest.TestCase):
+    """The order of the files in a folder decides which recordings share a card."""
+
+    NAMES = ["audio (10).m4a", "audio (2).m4a", "audio.m4a", "audio (1).m4a", "Intro.m4a"]
+    EXPECTED = ["Intro.m4a", "audio.m4a", "audio (1).m4a", "audio (2).m4a", "audio (10).m4a"]
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        for name in self.NAMES:
+            open(os.path.join(self.folder.name, name), "w").close()
+        for name in ("Scene 10", "Finale", "Scene 2"):
+            os.mkdir(os.path.join(self.folder.name, name))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_unnumbered_files_come_first(self):
+        self.assertEqual(list_audio_files(self.folder.name), self.EXPECTED)
+
+    def test_folders_keep_natural_order(self):
+        dirs, _ = list_folder(self.folder.name)
+        self.assertEqual(dirs, ["Finale", "Scene 2", "Scene 10"])
+
+    def test_cached_listing_is_sorted_again(self):
+        with tempfile.TemporaryDirectory() as index_dir:
+            with ScanIndex(os.path.join(index_dir, "index.sqlite")) as index:
+                # A listing indexed in another order, as older versions stored it
+                index.connection.execute(
+                    "INSERT INTO folders (path, mtime_ns, listing) VALUES (?, ?, ?)",
+                    (os.path.abspath(self.folder.name), os.stat(self.folder.name).st_mtime_ns,
+                     '{"dirs": [], "files": ["audio (1).m4a", "audio.m4a"]}'),
+                )
+                self.assertEqual(list_folder(self.folder.name, index)[1], ["audio.m4a", "audio (1).m4a"])
+
+
+class FileHashTest(unittest.TestCase):
+
+    def test_hash_spans_chunks(self):
+        content = os.urandom(HASH_CHUNK_SIZE * 2 + 17)
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "audio.m4a")
+            with open(path, "wb") as f:
+                f.write(content)
+            self.assertEqual(file_hash(path), hashlib.sha256(content).hexdigest())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+"""
+Loads the command-line scripts (e.g. 'convert-audio.py') as Python modules.
+Their file names contain dashes, so they cannot be imported with a normal import.
+"""
+
+import importlib.util
+import os
+import sys
+import threading
+
+TOOL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_lock = threading.Lock()
+
+
+def load_tool(script_name):
+    """
+    Import a script from the tool folder and return it as a module.
+    'convert-audio.py' becomes the module 'convert_audio'; it is loaded only once.
+    """
+    module_name = os.path.splitext(script_name)[0].replace("-", "_")
+    with _lock:
+        if module_name in sys.modules:
+            return sys.modules[module_name]
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(TOOL_DIR, script_name))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[module_name]
+            raise
+        return module